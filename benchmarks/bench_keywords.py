@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of whitelist/blacklist checks: the Aho-Corasick KeywordMatcher
+against the previous loop with one substring scan per word.
+
+Run from the repository root:
+$ python benchmarks/bench_keywords.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vktgbot"))
+
+from keyword_filter import KeywordMatcher  # noqa: E402
+
+
+def legacy_find(words: list, text: str):
+    text_lower = text.lower()
+    for word in words:
+        if word.lower() in text_lower:
+            return word
+    return None
+
+
+def make_words(count: int) -> list:
+    rng = random.Random(count)
+    alphabet = "абвгдеёжзийклмнопрстуфхцчшщьыэюяabcdefghijklmnopqrstuvwxyz"
+    words = []
+    for i in range(count):
+        word = "".join(rng.choice(alphabet) for _ in range(rng.randint(5, 14)))
+        words.append(f"#{word}" if i % 3 == 0 else word)
+    return words
+
+
+def make_post(length: int) -> str:
+    paragraph = "Обзор новой JRPG недели: сюжет, боевая система и музыка. #обзор #jrpg@jrpg.wiki\n"
+    return (paragraph * (length // len(paragraph) + 1))[:length]
+
+
+def main() -> None:
+    text = make_post(2000)
+    print(f"{'words':>6} {'loop, us':>9} {'matcher, us':>12} {'speedup':>8} {'build, ms':>10}")
+    for count in (10, 100, 1000, 5000):
+        words = make_words(count)
+        started = timeit.default_timer()
+        matcher = KeywordMatcher(words)
+        build = (timeit.default_timer() - started) * 1000
+        # Худший случай для чёрного списка: ни одно слово не встречается в посте
+        assert matcher.find(text) is None and legacy_find(words, text) is None
+        number = 200
+        legacy = timeit.timeit(lambda: legacy_find(words, text), number=number) / number * 1e6
+        single = timeit.timeit(lambda: matcher.find(text), number=number) / number * 1e6
+        print(f"{count:>6} {legacy:>9.1f} {single:>12.1f} {legacy / single:>7.1f}x {build:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
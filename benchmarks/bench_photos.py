@@ -0,0 +1,96 @@
+"""
+Micro-benchmark of photo size selection: the single-pass resolver with a
+precompiled URL pattern against the previous scan per size type.
+
+Run from the repository root:
+$ python benchmarks/bench_photos.py
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vktgbot"))
+
+from photo_size import choose_photo_size, normalize_photo_url  # noqa: E402
+
+# Размеры VK: тип и длинная сторона в пикселях
+SIZE_TYPES = [("s", 75), ("m", 130), ("x", 604), ("o", 130), ("p", 200), ("q", 320), ("r", 510), ("y", 807),
+              ("z", 1080), ("w", 2560)]
+
+
+def legacy_get_photo(attachment: dict):
+    photo_id = f"photo{attachment['photo']['owner_id']}_{attachment['photo']['id']}"
+    sizes = attachment["photo"]["sizes"]
+    types = ["w", "z", "y", "x", "r", "q", "p", "o", "m", "s"]
+
+    for type_ in types:
+        if next(
+            (item for item in sizes if item["type"] == type_),
+            False,
+        ):
+            return {
+                "id": photo_id,
+                "url": re.sub(
+                    "&([a-zA-Z]+(_[a-zA-Z]+)+)=([a-zA-Z0-9-_]+)",
+                    "",
+                    next(
+                        (item for item in sizes if item["type"] == type_),
+                        False,
+                    )["url"],
+                ),
+            }
+    else:
+        return None
+
+
+def get_photo(attachment: dict, max_side: int = 0, max_bytes: int = 0):
+    photo_id = f"photo{attachment['photo']['owner_id']}_{attachment['photo']['id']}"
+    size = choose_photo_size(attachment["photo"]["sizes"], max_side, max_bytes)
+    if size is None:
+        return None
+    return {"id": photo_id, "url": normalize_photo_url(size["url"])}
+
+
+def make_album(count: int, seed: int = 1) -> list:
+    """Фото с полным набором размеров; у части фото самых больших размеров нет."""
+    rng = random.Random(seed)
+    album = []
+    for photo_id in range(count):
+        types = SIZE_TYPES[: rng.choice((8, 9, 10, 10))]
+        sizes = [
+            {
+                "type": type_,
+                "width": side,
+                "height": side * 2 // 3,
+                "url": f"https://sun9-{photo_id % 90}.userapi.com/impg/{photo_id}_{type_}.jpg"
+                f"?size={side}x{side * 2 // 3}&quality=95&sign=abc{photo_id}&c_uniq_tag=tag{photo_id}&type=album",
+            }
+            for type_, side in types
+        ]
+        rng.shuffle(sizes)
+        album.append({"type": "photo", "photo": {"owner_id": -1, "id": photo_id, "sizes": sizes}})
+    return album
+
+
+def main() -> None:
+    for album in (make_album(10), make_album(1000)):
+        assert [legacy_get_photo(photo) for photo in album] == [get_photo(photo) for photo in album]
+
+    print(f"{'photos':>7} {'legacy, us':>11} {'resolver, us':>13} {'speedup':>8} {'max 1280 px, us':>16}")
+    for count in (10, 100, 1000):
+        album = make_album(count, seed=count)
+        number = max(1, 2000 // count)
+        legacy = timeit.timeit(lambda: [legacy_get_photo(photo) for photo in album], number=number) / number
+        resolver = timeit.timeit(lambda: [get_photo(photo) for photo in album], number=number) / number
+        limited = timeit.timeit(lambda: [get_photo(photo, max_side=1280) for photo in album], number=number) / number
+        print(
+            f"{count:>7} {legacy * 1e6:>11.0f} {resolver * 1e6:>13.0f} {legacy / resolver:>7.1f}x "
+            f"{limited * 1e6:>16.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Simulation of wall polling over four weeks of posts: the adaptive interval against
+a fixed one. Counts wall.get calls and the delay between publication and pickup.
+
+Run from the repository root:
+$ python benchmarks/bench_polling.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vktgbot"))
+
+from polling import AdaptiveInterval  # noqa: E402
+
+DAY = 24 * 3600
+
+
+def make_posts(days: int, seed: int = 1) -> list:
+    """Посты днём сериями по 1-3 со средним промежутком в час, ночью тишина."""
+    rng = random.Random(seed)
+    posts = []
+    for day in range(days):
+        moment = day * DAY + 9 * 3600
+        while moment < day * DAY + 23 * 3600:
+            for _ in range(rng.choice((1, 1, 2, 3))):
+                posts.append(int(moment))
+                moment += rng.uniform(60, 300)
+            moment += rng.expovariate(1 / 3600)
+    return posts
+
+
+def simulate(posts: list, polling: AdaptiveInterval = None, interval: float = 300) -> tuple:
+    now, index, calls, delays = 0.0, 0, 0, []
+    end = posts[-1] + 1
+    while now < end:
+        calls += 1
+        new = []
+        while index < len(posts) and posts[index] <= now:
+            new.append(posts[index])
+            delays.append(now - posts[index])
+            index += 1
+        if polling:
+            polling.observe(new)
+            interval = polling.next_interval(bool(new), now)
+        now += interval
+    delays.sort()
+    return calls, sum(delays) / len(delays), delays[len(delays) * 99 // 100]
+
+
+def main() -> None:
+    random.seed(1)
+    posts = make_posts(28)
+    print(f"{len(posts)} posts in 28 days")
+    print(f"{'mode':>28} {'wall.get calls':>15} {'mean delay, s':>14} {'p99 delay, s':>13}")
+    for interval in (120, 300):
+        calls, mean, p99 = simulate(posts, interval=interval)
+        print(f"{f'fixed {interval} s':>28} {calls:>15} {mean:>14.0f} {p99:>13.0f}")
+    for base in (300, 450):
+        calls, mean, p99 = simulate(posts, AdaptiveInterval(base, 60, 1800))
+        print(f"{f'adaptive from {base} s':>28} {calls:>15} {mean:>14.0f} {p99:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
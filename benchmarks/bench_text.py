@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of post text preparation: TextTransformer against the
+previous pipeline (HTML escaping, reformat_vk_links and str.replace) on a plain
+post and on posts with many VK mentions.
+
+Run from the repository root:
+$ python benchmarks/bench_text.py
+"""
+
+import os
+import re
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vktgbot"))
+
+from loguru import logger  # noqa: E402
+
+from authors import AuthorRegistry  # noqa: E402
+from tools import TextTransformer  # noqa: E402
+
+REPLACEMENTS = {"@jrpg.wiki": "@jrpg_wiki"}
+
+
+AUTHORS = {}
+
+
+def legacy_prepare_text(text: str) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    match = re.search(r"\[([\w.]+?)\|(.+?)\]", text)
+    while match:
+        left_text = text[: match.span()[0]]
+        right_text = text[match.span()[1] :]
+        matching_text = text[match.span()[0] : match.span()[1]]
+
+        link_domain, link_text = re.findall(r"\[(.+?)\|(.+?)\]", matching_text)[0]
+        new_link = AUTHORS.get(link_domain, f"https://vk.com/{link_domain}")
+        logger.info(f"Replaced {link_domain} with {new_link}")
+        html_link = f'<a href="{new_link}">{link_text}</a>' if new_link != "t.me/0" else link_text
+        text = left_text + html_link + right_text
+        match = re.search(r"\[([\w.]+?)\|(.+?)\]", text)
+    for old, new in REPLACEMENTS.items():
+        text = text.replace(old, new)
+    return text
+
+
+def make_post(mentions: int) -> str:
+    paragraph = (
+        'Обзор от [id{0}|автора {0}] & "друзей" — <новая> JRPG недели, подробнее в @jrpg.wiki. '
+        "Спасибо [club{0}|сообществу] за помощь!\n\n"
+    )
+    return "".join(paragraph.format(i) for i in range(mentions // 2))
+
+
+def make_plain_post(paragraphs: int) -> str:
+    """Обычный пост без упоминаний и спецсимволов HTML."""
+    paragraph = "Новая JRPG недели вышла на всех платформах, подробнее в @jrpg.wiki. Делитесь впечатлениями!\n\n"
+    return paragraph * paragraphs
+
+
+def main() -> None:
+    logger.remove()
+    handles = {f"id{i}": f"author{i}" for i in range(0, 1000, 3)}
+    handles["id1"] = "0"
+    AUTHORS.update({domain: f"t.me/{handle}" for domain, handle in handles.items()})
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+        file.write("".join(f"{domain},{handle}\n" for domain, handle in handles.items()))
+    transformer = TextTransformer(REPLACEMENTS, AuthorRegistry(file.name))
+
+    def prepare(text: str) -> str:
+        return transformer.replace_literals(transformer(text))
+
+    print(f"{'post':>12} {'chars':>8} {'legacy, ms':>11} {'transformer, ms':>16} {'speedup':>8}")
+    cases = [("plain", make_plain_post(5))] + [(f"{n} mentions", make_post(n)) for n in (10, 100, 500, 2000)]
+    for name, text in cases:
+        assert prepare(text) == legacy_prepare_text(text)
+        number = max(1, 200000 // len(text))
+        legacy = timeit.timeit(lambda: legacy_prepare_text(text), number=number) / number * 1000
+        single = timeit.timeit(lambda: prepare(text), number=number) / number * 1000
+        print(f"{name:>12} {len(text):>8} {legacy:>11.3f} {single:>16.3f} {legacy / single:>7.1f}x")
+    os.remove(file.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Local fake VK API, media CDN and Telegram Bot API for offline benchmarks.
+
+VK answers come from recorded JSON fixtures: <method>.json files with the
+original API response. All media URLs in them are rewritten to the fake CDN,
+which answers HEAD with a plausible Content-Length and GET with that many bytes.
+
+It can also run on its own, e.g. to test the Callback API with
+scripts/callback_stub.py without VK and Telegram. The newest --unpublished posts
+are kept off the wall until the bot requests them with wall.getById:
+$ python benchmarks/fake_api.py --unpublished 2
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import re
+from typing import Dict, List
+
+from aiohttp import web
+
+# Размеры видео по качеству для HEAD-запросов, в байтах на секунду ролика
+VIDEO_BYTES_PER_SECOND = {"240": 40_000, "360": 70_000, "480": 120_000, "720": 250_000, "1080": 500_000}
+EXECUTE_CALL_PATTERN = re.compile(r"API\.([\w.]+)\((\{.*?\})\)(?=[,\]])")
+
+
+class FakeApi:
+    def __init__(
+        self,
+        fixtures_dir: str,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        repeat: int = 1,
+        vk_latency: float = 0.0,
+        tg_latency: float = 0.0,
+        media_latency: float = 0.0,
+        flood_every: int = 0,
+        flood_wait: int = 1,
+        unpublished: int = 0,
+    ):
+        self.base_url = f"http://{host}:{port}"
+        self.host, self.port = host, port
+        self.vk_latency, self.tg_latency, self.media_latency = vk_latency, tg_latency, media_latency
+        self.flood_every, self.flood_wait = flood_every, flood_wait
+        self.media_sizes: Dict[str, int] = {}
+        self.tg_requests = 0
+        self.tg_floods = 0
+        self.tg_methods: Dict[str, int] = {}
+        self.vk_methods: Dict[str, int] = {}
+        self.message_ids = itertools.count(1)
+        self.media_names = itertools.count(1)
+        self.runner: web.AppRunner = None
+
+        wall = self._load(fixtures_dir, "wall.get")
+        videos = self._load(fixtures_dir, "video.get")
+        self.groups = self._load(fixtures_dir, "groups.getById") or []
+        # Копии записанной стены сдвигаются на stride, чтобы ID постов и медиа не повторялись
+        self.stride = max((post["id"] for post in wall["items"]), default=0) + 1
+        self.posts = self._replicate(wall["items"], repeat)
+        # Самые свежие посты не видны в wall.get, пока их не запросят через wall.getById,
+        # как запись, о которой VK прислал событие Callback API раньше, чем стену опросили
+        newest = sorted((post["id"] for post in self.posts if not post.get("is_pinned")), reverse=True)
+        self.unpublished = set(newest[:unpublished])
+        self.videos = {f"{video['owner_id']}_{video['id']}": video for video in (videos or {}).get("items", [])}
+
+    def _load(self, fixtures_dir: str, method: str):
+        path = os.path.join(fixtures_dir, f"{method}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return self._rewrite_urls(json.load(file)["response"])
+
+    def _rewrite_urls(self, value, key: str = ""):
+        """Ссылки на медиа ведут на локальный CDN, который помнит размеры документов для HEAD."""
+        if isinstance(value, dict):
+            if "url" in value and isinstance(value.get("size"), int):
+                self.media_sizes[value["url"]] = value["size"]
+            return {item_key: self._rewrite_urls(item, item_key) for item_key, item in value.items()}
+        if isinstance(value, list):
+            return [self._rewrite_urls(item, key) for item in value]
+        if isinstance(value, str) and value.startswith("http") and (key == "url" or key.startswith("mp4_")):
+            name = f"m{next(self.media_names)}_{key}"
+            self.media_sizes[name] = self.media_sizes.pop(value, 0)
+            return f"{self.base_url}/media/{name}"
+        return value
+
+    def _replicate(self, posts: List[dict], repeat: int) -> List[dict]:
+        """Повторяет записанную стену `repeat` раз с новыми ID постов и медиа, от новых к старым."""
+        result = []
+        for copy_number in range(repeat - 1, -1, -1):
+            for post in posts:
+                post = copy.deepcopy(post)
+                post["id"] += copy_number * self.stride
+                for attachment in post.get("attachments", []):
+                    media = attachment.get(attachment["type"], {})
+                    if "id" in media:
+                        media["id"] += copy_number * self.stride
+                if copy_number and post.get("is_pinned"):
+                    del post["is_pinned"]
+                result.append(post)
+        return result
+
+    # VK API
+
+    async def vk_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.vk_methods[method] = self.vk_methods.get(method, 0) + 1
+        await asyncio.sleep(self.vk_latency)
+        if method == "execute":
+            response = [
+                self.vk_response(called, json.loads(call_params))
+                for called, call_params in EXECUTE_CALL_PATTERN.findall(params["code"])
+            ]
+        else:
+            response = self.vk_response(method, params)
+        return web.json_response({"response": response})
+
+    def vk_response(self, method: str, params: dict):
+        if method == "wall.get":
+            offset, count = int(params.get("offset", 0)), int(params.get("count", 20))
+            posts = [post for post in self.posts if post["id"] not in self.unpublished]
+            return {"count": len(posts), "items": posts[offset : offset + count]}
+        if method == "wall.getById":
+            # Фикстуры записаны с одной стены, поэтому пост ищется только по своему ID
+            post_ids = {int(key.rsplit("_", 1)[1]) for key in str(params.get("posts", "")).split(",") if "_" in key}
+            self.unpublished -= post_ids
+            return [post for post in self.posts if post["id"] in post_ids]
+        if method == "video.get":
+            items = []
+            for key in str(params.get("videos", "")).split(","):
+                owner_id, video_id = key.split("_")[:2]
+                video = self.videos.get(f"{owner_id}_{int(video_id) % self.stride}")
+                if video:
+                    items.append(dict(video, id=int(video_id)))
+            return {"count": len(items), "items": items}
+        if method == "groups.getById":
+            return self.groups
+        return False
+
+    # Медиа
+
+    async def media(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        await asyncio.sleep(self.media_latency)
+        size = self.media_sizes.get(name, 0)
+        quality = re.search(r"_mp4_(\d+)$", name)
+        if quality:
+            size = VIDEO_BYTES_PER_SECOND.get(quality.group(1), 100_000) * 120
+        size = size or 150_000
+        if request.method == "HEAD":
+            return web.Response(headers={"Content-Length": str(size)})
+        return web.Response(body=b"\0" * size)
+
+    # Telegram Bot API
+
+    async def tg_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        data = await request.post()
+        self.tg_requests += 1
+        await asyncio.sleep(self.tg_latency)
+        if self.flood_every and self.tg_requests % self.flood_every == 0:
+            self.tg_floods += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.flood_wait}",
+                    "parameters": {"retry_after": self.flood_wait},
+                },
+                status=429,
+            )
+
+        self.tg_methods[method] = self.tg_methods.get(method, 0) + 1
+        chat = {"id": -1001, "type": "channel", "title": "bench"}
+        if method == "sendmediagroup":
+            messages = []
+            for media in json.loads(data["media"]):
+                message = {"message_id": next(self.message_ids), "date": 0, "chat": chat}
+                file_id = f"file{message['message_id']}"
+                if media["type"] == "photo":
+                    message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+                elif media["type"] == "video":
+                    message["video"] = {
+                        "file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1, "duration": 1
+                    }
+                else:
+                    message["document"] = {"file_id": file_id, "file_unique_id": file_id}
+                messages.append(message)
+            return web.json_response({"ok": True, "result": messages})
+        message = {"message_id": next(self.message_ids), "date": 0, "chat": chat}
+        return web.json_response({"ok": True, "result": message})
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_post("/method/{method}", self.vk_method)
+        app.router.add_route("*", "/media/{name}", self.media)
+        app.router.add_post("/bot{token}/{method}", self.tg_method)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        await self.runner.cleanup()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    fake = FakeApi(args.fixtures, host=args.host, port=args.port, repeat=args.repeat, unpublished=args.unpublished)
+    await fake.start()
+    print(f"VK API: {fake.base_url}/method/, Telegram Bot API: {fake.base_url}")
+    print(f"Unpublished posts: {', '.join(map(str, sorted(fake.unpublished))) or 'none'}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--unpublished", type=int, default=0, help="newest posts shown only by wall.getById")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
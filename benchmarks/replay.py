@@ -0,0 +1,213 @@
+"""
+Offline replay benchmark of the whole pipeline: recorded wall.get/video.get
+responses go through fetching, parsing and sending against local fake VK and
+Telegram servers. Reports posts/sec, p50/p99 latency per stage and peak memory.
+
+Run from the repository root:
+$ python benchmarks/replay.py
+$ python benchmarks/replay.py --repeat 10 --channels 3 --tg-latency 0.05 --flood-every 20
+
+Record your own fixtures from a real wall (needs VAR_VK_TOKEN, the only online mode):
+$ python benchmarks/replay.py --record jrpg.wiki --fixtures ./my_fixtures
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "vktgbot"))
+DEFAULT_FIXTURES = os.path.join(BENCHMARKS_DIR, "fixtures")
+
+
+def percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def timed(stages: Dict[str, List[float]], stage: str, function):
+    """Обёртка корутины, которая записывает длительность каждого вызова в stages[stage]."""
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            stages.setdefault(stage, []).append(time.perf_counter() - started)
+
+    return wrapper
+
+
+async def replay(args: argparse.Namespace) -> None:
+    from aiogram import Bot
+    from aiogram.bot.api import TelegramAPIServer
+
+    import start_script
+    from fake_api import FakeApi
+    from file_cache import FileIdCache
+    from journal import Journal
+    from routes import Source
+    from scheduler import run_scheduler
+    from tg_sender import TelegramSender
+    from vk_client import RateLimiter, VkClient, create_session
+
+    fake = FakeApi(
+        args.fixtures,
+        port=args.port,
+        repeat=args.repeat,
+        vk_latency=args.vk_latency,
+        tg_latency=args.tg_latency,
+        media_latency=args.media_latency,
+        flood_every=args.flood_every,
+        flood_wait=args.flood_wait,
+    )
+    await fake.start()
+
+    # Стадии конвейера измеряются обёртками над функциями, через которые их вызывает start_script
+    stages: Dict[str, List[float]] = {}
+    start_script.get_new_posts = timed(stages, "fetch", start_script.get_new_posts)
+    start_script.get_post_metadata = timed(stages, "metadata", start_script.get_post_metadata)
+    start_script.parse_post = timed(stages, "parse", start_script.parse_post)
+    start_script.send_post = timed(stages, "send", start_script.send_post)
+    start_script.prepare_post = timed(stages, "prepare", start_script.prepare_post)
+    start_script.deliver_post = timed(stages, "deliver", start_script.deliver_post)
+
+    bot = Bot(token="123456:replay", server=TelegramAPIServer.from_base(fake.base_url))
+    file_cache = FileIdCache("./data/file_ids.sqlite3")
+    sender = TelegramSender(bot, file_cache, global_rate=args.tg_rate, chat_rate=args.tg_rate, chat_burst=args.tg_rate)
+    session = create_session()
+    vk = VkClient(session, "token", 5.103, RateLimiter(args.vk_rate), api_url=fake.base_url + "/method/")
+    journal = Journal("./data/journal.sqlite3")
+    source = Source(
+        name="replay",
+        vk_domain="replay",
+        tg_channels=[f"@replay{number}" for number in range(1, args.channels + 1)],
+        skip_reposts=False,
+        last_id=0,
+    )
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        await run_scheduler(sender, vk, journal, [source])
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await sender.close()
+        await session.close()
+        await (await bot.get_session()).close()
+        journal.close()
+        file_cache.close()
+        await fake.close()
+
+    posts = len(stages.get("prepare", []))
+    print(f"Posts: {posts} in {elapsed:.2f} s, {posts / elapsed:.1f} posts/sec, channels: {args.channels}")
+    print(f"VK requests: {fake.vk_methods}")
+    print(f"Telegram requests: {fake.tg_methods}, flood waits: {fake.tg_floods}")
+    print(f"{'stage':>10} {'calls':>7} {'p50, ms':>9} {'p99, ms':>9} {'max, ms':>9}")
+    for stage in ("fetch", "metadata", "parse", "prepare", "send", "deliver"):
+        values = stages.get(stage, [])
+        print(
+            f"{stage:>10} {len(values):>7} {percentile(values, 0.5) * 1000:>9.1f} "
+            f"{percentile(values, 0.99) * 1000:>9.1f} {max(values, default=0) * 1000:>9.1f}"
+        )
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak memory: {peak / 1024 / 1024:.1f} MB traced by Python, {max_rss:.1f} MB max RSS")
+
+
+async def record(args: argparse.Namespace) -> None:
+    """Сохраняет ответы wall.get, video.get и groups.getById настоящей стены в каталог фикстур."""
+    import config
+    from api_requests import get_data_from_vk, get_video_key
+    from vk_client import VkClient, create_session
+
+    session = create_session()
+    vk = VkClient(session, config.VK_TOKEN, config.REQ_VERSION)
+    try:
+        items = await get_data_from_vk(vk, args.record, "owner", 100) or []
+        attachments = [
+            attachment
+            for item in items
+            for part in [item] + item.get("copy_history", [])
+            for attachment in part.get("attachments", [])
+        ]
+        video_ids = [
+            get_video_key(attachment["video"])
+            + (f"_{attachment['video']['access_key']}" if attachment["video"].get("access_key") else "")
+            for attachment in attachments
+            if attachment["type"] == "video"
+        ]
+        videos = {"count": 0, "items": []}
+        for start in range(0, len(video_ids), 100):
+            response = await vk.call("video.get", videos=",".join(video_ids[start : start + 100]))
+            videos["items"] += response["items"]
+        videos["count"] = len(videos["items"])
+        group_ids = sorted({abs(item["copy_history"][0]["owner_id"]) for item in items if "copy_history" in item})
+        groups = await vk.call("groups.getById", group_ids=",".join(map(str, group_ids))) if group_ids else []
+    finally:
+        await session.close()
+
+    os.makedirs(args.fixtures, exist_ok=True)
+    responses = {"wall.get": {"count": len(items), "items": items}, "video.get": videos, "groups.getById": groups}
+    for method, response in responses.items():
+        with open(os.path.join(args.fixtures, f"{method}.json"), "w", encoding="utf-8") as file:
+            json.dump({"response": response}, file, ensure_ascii=False)
+    print(f"Saved {len(items)} posts and {videos['count']} videos to {args.fixtures}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="directory with <method>.json responses")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the recorded wall this many times")
+    parser.add_argument("--channels", type=int, default=1, help="number of Telegram channels per post")
+    parser.add_argument("--vk-latency", type=float, default=0.03, help="VK API latency, seconds")
+    parser.add_argument("--tg-latency", type=float, default=0.05, help="Telegram Bot API latency, seconds")
+    parser.add_argument("--media-latency", type=float, default=0.01, help="media CDN latency, seconds")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every N-th Telegram request with 429")
+    parser.add_argument("--flood-wait", type=int, default=1, help="retry_after of injected 429 answers")
+    parser.add_argument("--vk-rate", type=int, default=3, help="VK requests per second, as in production")
+    parser.add_argument("--tg-rate", type=float, default=1000, help="Telegram requests per second per chat")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--record", metavar="VK_DOMAIN", help="record fixtures from a real wall instead of replaying")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record(args))
+        return
+
+    # Настройки бота читаются при импорте модулей, поэтому задаются до него
+    os.environ.update(
+        VAR_SINGLE_START="true",
+        VAR_LOG_LEVEL="WARNING",
+        VAR_AUTHORS_FILE=os.path.join(os.path.abspath(args.fixtures), "authors.csv"),
+        VAR_MAX_DELIVERY_ATTEMPTS="1",
+    )
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    # Временный рабочий каталог для журнала, кэша file_id и скачанных документов
+    workdir = tempfile.mkdtemp(prefix="vktgbot-replay-")
+    fixtures = os.path.abspath(args.fixtures)
+    os.chdir(workdir)
+    args.fixtures = fixtures
+    try:
+        asyncio.run(replay(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
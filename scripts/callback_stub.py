@@ -0,0 +1,80 @@
+"""
+Local stand-in for VK Callback API: sends a confirmation request and
+wall_post_new events to a running bot, the way VK does.
+
+The bot takes only the post ID from an event and requests the post itself
+from VK, so --post-id has to be an existing post of the community.
+
+Run the bot with VAR_CALLBACK_ENABLED=true and VAR_CALLBACK_SECRET=mysecret,
+then from the repository root:
+$ python scripts/callback_stub.py --group-id 123 --secret mysecret --post-id 456
+
+Offline, the bot can get posts from the fake VK API of the benchmarks. It keeps
+the two newest recorded posts (5038 and 5039 of community 77) off the wall until
+the bot requests them by ID:
+$ python benchmarks/fake_api.py --unpublished 2
+$ echo 5037 > last_id.txt
+$ VAR_VK_API_URL=http://127.0.0.1:8765/method/ VAR_TG_API_URL=http://127.0.0.1:8765 \
+  VAR_VK_DOMAIN=jrpgclub VAR_TG_CHANNEL=@test VAR_TG_BOT_TOKEN=123456:test \
+  VAR_CALLBACK_ENABLED=true VAR_CALLBACK_SECRET=mysecret python vktgbot
+$ python scripts/callback_stub.py --group-id 77 --secret mysecret --post-id 5038 --post-id 5039
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+
+import aiohttp
+
+
+def make_event(event_type: str, group_id: int, secret: str, post: dict = None) -> dict:
+    event = {"type": event_type, "group_id": group_id, "event_id": uuid.uuid4().hex, "v": "5.199"}
+    if secret:
+        event["secret"] = secret
+    if post is not None:
+        event["object"] = post
+    return event
+
+
+def make_post(group_id: int, post_id: int, text: str) -> dict:
+    return {
+        "id": post_id,
+        "owner_id": -group_id,
+        "from_id": -group_id,
+        "date": int(time.time()),
+        "post_type": "post",
+        "marked_as_ads": 0,
+        "text": text,
+        "attachments": [],
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/vk/callback")
+    parser.add_argument("--group-id", type=int, required=True)
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--post-id", type=int, action="append", default=[], help="may be given several times")
+    parser.add_argument("--text", default="Test post from the Callback API stub")
+    parser.add_argument("--repeat", action="store_true", help="send every event twice, as VK does on timeouts")
+    args = parser.parse_args()
+
+    events = [make_event("confirmation", args.group_id, args.secret)]
+    for post_id in args.post_id:
+        post = make_post(args.group_id, post_id, args.text)
+        events.append(make_event("wall_post_new", args.group_id, args.secret, post))
+        if args.repeat:
+            events.append(events[-1])
+
+    async with aiohttp.ClientSession() as session:
+        for event in events:
+            started = time.perf_counter()
+            async with session.post(args.url, json=event) as response:
+                text = await response.text()
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{event['type']:>15} -> {response.status} {text!r} in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули бота импортируют друг друга по имени, как при запуске из каталога vktgbot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vktgbot"))
@@ -0,0 +1,91 @@
+import pytest
+
+from journal import ABANDONED, FAILED, SENT, Journal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / "journal.sqlite3"), cache_size=100, max_contents=50)
+    yield journal
+    journal.close()
+
+
+def test_mark_counts_attempts(journal):
+    assert journal.get_status("src", "@chan", 1, "post") is None
+    assert journal.mark("src", "@chan", 1, "post", FAILED) == 1
+    assert journal.mark("src", "@chan", 1, "post", FAILED) == 2
+    assert journal.mark("src", "@chan", 1, "post", ABANDONED) == 3
+    assert journal.get_status("src", "@chan", 1, "post") == ABANDONED
+
+
+def test_mark_keeps_parts_and_channels_apart(journal):
+    journal.mark("src", "@chan", 1, "post", SENT)
+    journal.mark("src", "@chan", 1, "repost", FAILED)
+    assert journal.get_status("src", "@chan", 1, "post") == SENT
+    assert journal.get_status("src", "@chan", 1, "repost") == FAILED
+    assert journal.get_status("src", "@other", 1, "post") is None
+
+
+def test_state_survives_reopening(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = Journal(path)
+    journal.set_last_id("src", 42)
+    journal.mark("src", "@chan", 43, "post", SENT)
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.get_last_id("src") == 42
+    assert journal.get_status("src", "@chan", 43, "post") == SENT
+    journal.close()
+
+
+def test_find_content_by_any_key(journal):
+    journal.remember_content("@chan", ["wall-1_1", "sha1:abc"], 10)
+    assert journal.find_content("@chan", ["wall-2_5", "sha1:abc"]) == 10
+    assert journal.find_content("@chan", ["wall-1_1"]) == 10
+    assert journal.find_content("@other", ["wall-1_1"]) is None
+
+
+def test_remembered_miss_is_updated(journal):
+    assert journal.find_content("@chan", ["wall-1_1"]) is None
+    journal.remember_content("@chan", ["wall-1_1"], 7)
+    assert journal.find_content("@chan", ["wall-1_1"]) == 7
+
+
+def test_first_message_is_kept(journal):
+    journal.remember_content("@chan", ["wall-1_1"], 7)
+    journal.remember_content("@chan", ["wall-1_1"], 8)
+    assert journal.find_content("@chan", ["wall-1_1"]) == 7
+
+
+def test_contents_are_evicted_in_batches(journal):
+    for index in range(50):
+        journal.remember_content("@chan", [f"key{index}"], index + 1)
+    assert journal.find_content("@chan", ["key0"]) == 1
+
+    journal.remember_content("@chan", ["key50"], 51)
+    rows = journal.db.execute("SELECT COUNT(*) FROM contents").fetchone()[0]
+    assert rows == 45
+    assert journal.contents_count == 45
+    # В памяти остаются записи, которые не были удалены из базы
+    assert journal.find_content("@chan", ["key50"]) == 51
+    assert journal.find_content("@chan", ["key0"]) is None
+
+
+def test_evicted_keys_leave_memory(journal):
+    for index in range(51):
+        journal.remember_content("@chan", [f"key{index}"], index + 1)
+    remaining = {row[0] for row in journal.db.execute("SELECT key FROM contents")}
+    cached = {key for (_, key), message_id in journal.contents.items() if message_id is not None}
+    assert cached <= remaining
+
+
+def test_contents_survive_reopening(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = Journal(path)
+    journal.remember_content("@chan", ["wall-1_43"], 5)
+    journal.close()
+
+    journal = Journal(path)
+    assert journal.find_content("@chan", ["wall-1_43"]) == 5
+    journal.close()
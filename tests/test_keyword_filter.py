@@ -0,0 +1,78 @@
+import pytest
+
+import keyword_filter
+from keyword_filter import KeywordMatcher
+
+
+@pytest.fixture(params=[False, True], ids=["scan", "automaton"])
+def build(request, monkeypatch):
+    """Матчер с коротким списком проверяется поиском по словам, с длинным — автоматом."""
+    if request.param:
+        monkeypatch.setattr(keyword_filter, "SCAN_LIST_SIZE", 1)
+    return KeywordMatcher
+
+
+def test_substring_mode(build):
+    matcher = build(["cat", "Dog"])
+    assert matcher.find("Concatenate") == "cat"
+    assert matcher.find("hotdogs") == "Dog"
+    assert matcher.find("bird") is None
+
+
+def test_word_mode(build):
+    matcher = build(["cat", "new game"], mode="word")
+    assert matcher.find("concatenate") is None
+    assert matcher.find("A cat, again") == "cat"
+    assert matcher.find("The New Game is out") == "new game"
+    assert matcher.find("renew games") is None
+
+
+def test_hashtag_mode(build):
+    matcher = build(["#music", "rock"], mode="hashtag")
+    assert matcher.find("#musicvideo") is None
+    assert matcher.find("new #music today") == "#music"
+    assert matcher.find("x#music") is None
+    assert matcher.find("#rock") is None
+    assert matcher.find("rock, #rock") == "rock"
+    assert matcher.find("rocket") is None
+
+
+def test_word_mode_treats_hash_as_separator(build):
+    matcher = build(["#music", "rock"], mode="word")
+    assert matcher.find("#musicvideo") is None
+    assert matcher.find("x#music") == "#music"
+    assert matcher.find("#rock") == "rock"
+
+
+def test_word_found_after_a_bounded_miss(build):
+    matcher = build(["cat"], mode="word")
+    assert matcher.find("concat cat") == "cat"
+
+
+def test_match_after_a_failed_longer_word(build):
+    # Автомат уходит из "abc" по ссылке неудачи в "bc" и находит "bce"
+    matcher = build(["abcd", "bce"])
+    assert matcher.find("abce") == "bce"
+
+
+def test_word_inside_an_unfinished_longer_word(build):
+    # "he" заканчивается в состоянии "she" — префиксе "sheep", и найдётся только по ссылке неудачи
+    matcher = build(["sheep", "he"])
+    assert matcher.find("shed") == "he"
+
+
+def test_bounded_match_inside_an_overlap(build):
+    matcher = build(["shell", "he"], mode="word")
+    assert matcher.find("shelf he") == "he"
+    assert matcher.find("shelf") is None
+
+
+def test_empty_list():
+    matcher = KeywordMatcher(["", ""])
+    assert not matcher
+    assert matcher.find("anything") is None
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        KeywordMatcher(["cat"], mode="regex")
@@ -0,0 +1,56 @@
+import pytest
+
+from leases import LeaseStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    path = str(tmp_path / "leases.sqlite3")
+    first, second = LeaseStore(path, "first", ttl=60), LeaseStore(path, "second", ttl=60)
+    yield first, second
+    first.db.close()
+    second.db.close()
+
+
+def test_source_has_one_owner(stores):
+    first, second = stores
+    assert first.try_acquire("src")
+    assert not second.try_acquire("src")
+    # Своя аренда берётся повторно и продлевается
+    assert first.try_acquire("src")
+
+
+def test_released_source_is_taken_over(stores):
+    first, second = stores
+    first.try_acquire("src")
+    first.release("src")
+    assert second.try_acquire("src")
+    assert first.renew(["src"]) == set()
+    assert second.renew(["src"]) == {"src"}
+
+
+def test_expired_lease_is_taken_over(stores):
+    first, second = stores
+    first.try_acquire("src")
+    first.db.execute("UPDATE leases SET expires_at = 0 WHERE source = 'src'")
+    assert second.try_acquire("src")
+    assert not first.try_acquire("src")
+
+
+def test_fair_share_counts_live_workers(stores):
+    first, second = stores
+    first.heartbeat()
+    assert first.fair_share(5) == 5
+    second.heartbeat()
+    assert first.fair_share(5) == 3
+
+
+def test_close_frees_sources(tmp_path):
+    path = str(tmp_path / "leases.sqlite3")
+    first, second = LeaseStore(path, "first"), LeaseStore(path, "second")
+    first.heartbeat()
+    first.try_acquire("src")
+    first.close()
+    assert second.try_acquire("src")
+    assert second.fair_share(4) == 4
+    second.db.close()
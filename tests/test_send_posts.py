@@ -0,0 +1,47 @@
+import asyncio
+from types import SimpleNamespace
+
+from send_posts import send_media_post, split_into_albums
+
+
+class FakeSender:
+    """Отправитель без сети: запоминает сообщения и альбомы."""
+
+    def __init__(self):
+        self.sent = []
+        self.bot = SimpleNamespace(send_message=self.send_message, send_media_group=self.send_media_group)
+        self.file_cache = SimpleNamespace(get=lambda key: None, remember=lambda keys, messages: None)
+
+    async def request(self, chat_id, method, *args, **kwargs):
+        return await method(*args, **kwargs)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(("message", text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def send_media_group(self, chat_id, group):
+        self.sent.append(("album", [media.caption for media in group.media]))
+        return [SimpleNamespace(message_id=len(self.sent)) for _ in group.media]
+
+
+def test_text_without_media_is_sent_as_message():
+    sender = FakeSender()
+    message_id = asyncio.run(send_media_post(sender, "@chan", "Впечатления от игры", [], []))
+    assert sender.sent == [("message", "Впечатления от игры")]
+    assert message_id == 1
+
+
+def test_short_text_is_caption_of_first_album():
+    sender = FakeSender()
+    photos = [{"id": f"photo{index}", "url": f"https://example.com/{index}.jpg"} for index in range(12)]
+    message_id = asyncio.run(send_media_post(sender, "@chan", "caption", photos, []))
+    assert [kind for kind, _ in sender.sent] == ["album", "album"]
+    assert sender.sent[0][1][0] == "caption"
+    assert not any(sender.sent[1][1])
+    assert message_id == 1
+
+
+def test_albums_are_balanced():
+    assert [len(album) for album in split_into_albums(list(range(11)))] == [6, 5]
+    assert [len(album) for album in split_into_albums(list(range(20)))] == [10, 10]
+    assert split_into_albums([]) == []
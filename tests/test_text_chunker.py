@@ -0,0 +1,78 @@
+import re
+
+from text_chunker import html_length, split_html, utf16_length
+
+TAG_PATTERN = re.compile(r"<[^<>]*>")
+
+
+def visible(text: str) -> str:
+    return TAG_PATTERN.sub("", text)
+
+
+def test_short_text_is_one_chunk():
+    assert split_html("Hello <b>world</b>", 100) == ["Hello <b>world</b>"]
+
+
+def test_chunks_fit_limit_and_keep_text():
+    text = " ".join(f"word{i}" for i in range(500))
+    chunks = split_html(text, 100)
+    assert len(chunks) > 1
+    assert all(html_length(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunk.strip() for chunk in chunks) == text
+
+
+def test_open_tags_are_closed_and_reopened():
+    text = '<a href="https://example.com">' + "link text " * 30 + "</a> tail"
+    chunks = split_html(text, 50)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.count("<a ") == chunk.count("</a>")
+    assert chunks[1].startswith('<a href="https://example.com">')
+
+
+def test_nested_tags_are_closed_in_reverse_order():
+    chunks = split_html("<b><i>" + "x " * 40 + "</i></b>", 20)
+    assert chunks[0].endswith("</i></b>")
+    assert chunks[1].startswith("<b><i>")
+
+
+def test_entity_counts_as_one_character_and_is_not_split():
+    text = "&amp;" * 30
+    assert html_length(text) == 30
+    chunks = split_html(text, 7)
+    assert all(re.fullmatch(r"(&amp;)+", chunk) for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_length_is_counted_in_utf16_units():
+    # Эмодзи вне BMP занимает в UTF-16 две единицы
+    assert utf16_length("😀") == 2
+    assert html_length("<b>😀</b>a") == 3
+    chunks = split_html("😀 " * 30, 10)
+    assert len(chunks) == 10
+    assert all(html_length(chunk) <= 10 for chunk in chunks)
+    assert "".join(chunks).count("😀") == 30
+
+
+def test_paragraph_break_is_preferred_over_space():
+    first = "a " * 30
+    text = first.strip() + "\n\n" + "b " * 30
+    chunks = split_html(text, 80)
+    assert visible(chunks[0]).strip() == first.strip()
+
+
+def test_paragraph_break_is_ignored_when_chunk_would_be_too_short():
+    text = "a\n\n" + "b " * 60
+    chunks = split_html(text, 80)
+    assert len(visible(chunks[0])) > 40
+
+
+def test_long_word_is_split():
+    chunks = split_html("x" * 250, 100)
+    assert len(chunks) == 4
+    assert all(html_length(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == "x" * 250
+
+
+def test_whitespace_only_chunks_are_dropped():
+    assert split_html("   ", 10) == []
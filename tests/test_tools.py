@@ -0,0 +1,68 @@
+import pytest
+
+from authors import AuthorRegistry
+from tools import CONTENT_HASH_MIN_TEXT, TextTransformer, add_urls_to_text, content_keys, lookup_content_keys
+
+
+def post(post_id: int, text: str, attachments: list = ()) -> dict:
+    return {"owner_id": -1, "id": post_id, "text": text, "attachments": list(attachments)}
+
+
+def photo(photo_id: int) -> dict:
+    return {"type": "photo", "photo": {"owner_id": -1, "id": photo_id}}
+
+
+def test_short_text_is_not_hashed():
+    first = content_keys(post(1, "Стрим сегодня в 20:00!"))
+    second = content_keys(post(2, "Стрим сегодня в 20:00!"))
+    assert first == ["wall-1_1"]
+    assert not set(first) & set(second)
+
+
+def test_long_text_is_hashed():
+    text = "a" * CONTENT_HASH_MIN_TEXT
+    first, second = content_keys(post(1, text)), content_keys(post(2, text))
+    assert first[0] != second[0]
+    assert first[1] == second[1]
+
+
+def test_attachments_are_hashed_with_short_text():
+    first = content_keys(post(1, "Скриншот", [photo(10)]))
+    second = content_keys(post(2, "Скриншот", [photo(10)]))
+    other = content_keys(post(3, "Скриншот", [photo(11)]))
+    assert first[1] == second[1]
+    assert first[1] != other[1]
+
+
+def test_posts_are_looked_up_by_id_only():
+    keys = content_keys(post(1, "Скриншот", [photo(10)]))
+    assert lookup_content_keys("post", keys) == keys[:1]
+    assert lookup_content_keys("repost", keys) == keys
+
+
+@pytest.fixture
+def transformer(tmp_path):
+    authors = tmp_path / "authors.csv"
+    authors.write_text("id1,author\nid2,0\n")
+    return TextTransformer({"@jrpg.wiki": "@jrpg_wiki", "@jrpg": "@other"}, AuthorRegistry(str(authors)))
+
+
+def test_plain_text_is_unchanged(transformer):
+    assert transformer("Новая JRPG недели") == "Новая JRPG недели"
+
+
+def test_html_is_escaped(transformer):
+    assert transformer('<b> & "x"') == "&lt;b&gt; &amp; &quot;x&quot;"
+
+
+def test_vk_links(transformer):
+    text = transformer("[id1|Автор] и [id2|Аноним] в [club3|<группе>]")
+    assert text == ('<a href="t.me/author">Автор</a> и Аноним в '
+                    '<a href="https://vk.com/club3">&lt;группе&gt;</a>')
+
+
+def test_replacements_cover_appended_links(transformer):
+    text = add_urls_to_text(transformer("Подробнее в @jrpg.wiki"), ["https://t.me/s/@jrpg.wiki"], [])
+    text = transformer.replace_literals(text)
+    assert "@jrpg.wiki" not in text
+    assert "@other" not in text
@@ -6,45 +6,156 @@ v3.1
 by @alcortazzo
 """
 
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
 import time
+from typing import Union
 
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
 from loguru import logger
 
-from config import SINGLE_START, TIME_TO_SLEEP
-from start_script import start_script
-from tools import prepare_temp_folder, authors
-
-logger.add(
-    "./logs/vktgbot.log",
-    format="{time} {level} {message}",
-    level="DEBUG",
-    rotation="1 week",
-    compression="zip",
+from api_requests import metadata_cache
+from config import (
+    CALLBACK_ENABLED,
+    DEDUP_CACHE_SIZE,
+    DEDUP_MAX_ENTRIES,
+    FILE_ID_CACHE_PATH,
+    FILE_ID_CACHE_SIZE,
+    JOURNAL_PATH,
+    LEASE_TTL,
+    LEASES_PATH,
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_SAMPLE_RATE,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    METRICS_PORT,
+    REQ_VERSION,
+    SINGLE_START,
+    TG_API_URL,
+    TG_BOT_TOKEN,
+    TG_CHAT_RATE,
+    TG_GLOBAL_RATE,
+    TG_MAX_TRIES,
+    VK_API_URL,
+    VK_RATE_LIMIT,
+    VK_TOKEN,
+    WORKER_MODE,
+    WORKERS,
 )
+from file_cache import FileIdCache
+from journal import Journal
+from leases import LeaseStore
+from log_context import STDERR_FORMAT, TEXT_FORMAT, LogSampler, keep_record
+from metrics import start_metrics_server
+from routes import load_sources
+from scheduler import run_scheduler, run_worker
+from tg_sender import TelegramSender
+from vk_client import RateLimiter, VkClient, create_session
 
-logger.info("Script is started.")
-# №open("./last_id.txt", "w").write("163715") # 163715 163846
 
+def setup_logging(worker: str = "") -> None:
+    # Отладочные сообщения не форматируются вовсе, если ни один обработчик не принимает DEBUG
+    logger.remove()
+    logger.configure(patcher=LogSampler(LOG_SAMPLE_RATE))
+    # Записи пишутся в отдельном потоке (enqueue): медленный диск или консоль не тормозят обработку постов
+    serialize = LOG_FORMAT == "json"
+    logger.add(
+        sys.stderr, level=LOG_LEVEL, format=STDERR_FORMAT, filter=keep_record, serialize=serialize, enqueue=True
+    )
+    # У каждого процесса свой файл лога: ротация одного файла из нескольких процессов небезопасна
+    logger.add(
+        f"./logs/vktgbot.{worker}.log" if worker else "./logs/vktgbot.log",
+        format=TEXT_FORMAT,
+        level=LOG_LEVEL,
+        filter=keep_record,
+        serialize=serialize,
+        enqueue=True,
+        rotation="1 week",
+        compression="zip",
+    )
 
-@logger.catch
-def main():
-    # Reading authors from the csv
-    with open("authors.csv", "r+") as file:
-        for line in file.readlines():
-            authors[line.split(",")[0]] = "t.me/" + line.split(",")[1].replace("\n", "")
-    start_script()
-    prepare_temp_folder()
 
+async def main(worker_index: Union[int, None] = None) -> None:
+    # Лимиты Telegram и VK общие для бота и токена, поэтому делятся между процессами
+    workers = max(1, WORKERS)
+    # Один бот и одна HTTP-сессия на всё время работы процесса
+    bot = Bot(token=TG_BOT_TOKEN, server=TelegramAPIServer.from_base(TG_API_URL))
+    file_cache = FileIdCache(FILE_ID_CACHE_PATH, FILE_ID_CACHE_SIZE)
+    sender = TelegramSender(bot, file_cache, TG_GLOBAL_RATE / workers, TG_CHAT_RATE / 60, max_tries=TG_MAX_TRIES)
+    session = create_session()
+    vk = VkClient(session, VK_TOKEN, REQ_VERSION, RateLimiter(VK_RATE_LIMIT, period=workers), api_url=VK_API_URL)
+    journal = Journal(JOURNAL_PATH, DEDUP_CACHE_SIZE, DEDUP_MAX_ENTRIES, cache_misses=not WORKER_MODE)
+    leases = LeaseStore(LEASES_PATH, f"{socket.gethostname()}-{os.getpid()}", LEASE_TTL) if WORKER_MODE else None
+    metrics_port = METRICS_PORT + (worker_index or 0)
+    metrics_server = await start_metrics_server(METRICS_HOST, metrics_port) if METRICS_ENABLED else None
+    try:
+        if leases:
+            if CALLBACK_ENABLED:
+                logger.warning("Callback API is not used in the worker mode, sources are polled.")
+            await run_worker(sender, vk, journal, load_sources(), leases)
+        else:
+            await run_scheduler(sender, vk, journal, load_sources())
+        logger.info("Script has successfully completed its execution")
+    finally:
+        if metrics_server:
+            await metrics_server.cleanup()
+        await sender.close()
+        await session.close()
+        await (await bot.get_session()).close()
+        if leases:
+            leases.close()
+        journal.close()
+        file_cache.close()
+        metadata_cache.close()
 
-while True:
+
+def run_worker_process(index: int) -> None:
+    setup_logging(f"worker{index}")
+    logger.info(f"Worker {index} is started.")
     try:
-        main()
+        asyncio.run(main(index))
+    except KeyboardInterrupt:
+        logger.info(f"Worker {index} is stopped by the user.")
+    finally:
+        # Процесс multiprocessing не вызывает atexit: очередь записей лога дописывается здесь
+        logger.remove()
+
+
+def run_workers(count: int) -> None:
+    """
+    Запускает процессы-обработчики и перезапускает упавшие. Источники упавшего процесса
+    тем временем забирают другие, когда истекут его аренды.
+    """
+    processes = {}
+    while True:
+        for index in range(count):
+            process = processes.get(index)
+            if process is not None and (process.is_alive() or SINGLE_START):
+                continue
+            if process is not None:
+                logger.warning(f"Worker {index} exited with code {process.exitcode}. Restarting it.")
+            processes[index] = multiprocessing.Process(target=run_worker_process, args=(index,), daemon=False)
+            processes[index].start()
         if SINGLE_START:
-            logger.info("Script has successfully completed its execution")
-            exit()
+            for process in processes.values():
+                process.join()
+            return
+        time.sleep(5)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    logger.info("Script is started.")
+    # №open("./last_id.txt", "w").write("163715") # 163715 163846
+    try:
+        if WORKERS > 1:
+            run_workers(WORKERS)
         else:
-            logger.info(f"Script went to sleep for {TIME_TO_SLEEP} seconds.")
-            time.sleep(TIME_TO_SLEEP)
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Script is stopped by the user.")
-        exit()
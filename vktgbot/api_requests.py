@@ -1,16 +1,37 @@
+import asyncio
 import json
-from typing import Union
+from typing import Dict, List, Tuple, Union
 
 import re
 
-import requests
+import aiohttp
 from loguru import logger
-from requests import ConnectTimeout
 
+from config import GROUP_NAME_TTL, VIDEO_INFO_TTL, VK_CACHE_NEGATIVE_TTL, VK_CACHE_PATH, VK_CACHE_SIZE
+from log_context import videos_logger
+from metadata_cache import MetadataCache
+from video_size import choose_video_url
+from vk_client import VkApiError, VkClient
 
-def get_data_from_vk(
-    vk_token: str, req_version: float, vk_domain: str, req_filter: str, req_count: int, offset: int = 0
-) -> Union[dict, None]:
+VK_MAX_PAGE_SIZE = 100
+
+# Названия сообществ и файлы видео из VK, общие для всех источников
+metadata_cache = MetadataCache(VK_CACHE_PATH, VK_CACHE_SIZE, VK_CACHE_NEGATIVE_TTL)
+
+
+def response_items(response: Union[dict, list, None], key: str) -> list:
+    """
+    Список из ответа VK. Методы *.getById в старых версиях API возвращают список,
+    а в новых — объект, где список лежит в поле key (groups, items).
+    """
+    if not response:
+        return []
+    return response.get(key, []) if isinstance(response, dict) else response
+
+
+async def get_data_from_vk(
+    vk: VkClient, vk_domain: str, req_filter: str, req_count: int, offset: int = 0
+) -> Union[list, None]:
     logger.info("Trying to get posts from VK.")
 
     match = re.search("^(club|public)(\d+)$", vk_domain)
@@ -20,90 +41,165 @@ def get_data_from_vk(
         source_param = {"domain": vk_domain}
 
     try:
-        response = requests.get(
-            "https://api.vk.com/method/wall.get",
-            params=dict(
-                {
-                    "access_token": vk_token,
-                    "v": req_version,
-                    "filter": req_filter,
-                    "count": req_count,
-                    "offset": offset,
-                },
-                **source_param,
-            ),
-#            proxies={'http': "http://proxy.server:3128", 'https': "http://proxy.server:3128"},
-        )
-        data = response.json()
-        if "response" in data:
-            return data["response"]["items"]
-        elif "error" in data:
-            logger.error("Error was detected when requesting data from VK: " f"{data['error']['error_msg']}")
-    except ConnectTimeout as e:
-        logger.error("Got timeout when requesting data from VK:")
+        response = await vk.call("wall.get", filter=req_filter, count=req_count, offset=offset, **source_param)
+        return response["items"]
+    except VkApiError as e:
+        logger.error(f"Error was detected when requesting data from VK: {e.message}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("Got an error when requesting data from VK:")
         logger.error(e)
     return None
 
 
-def get_video_url(vk_token: str, req_version: float, owner_id: str, video_id: str, access_key: str, videos_urls: list) -> str:
-    response = requests.get(
-        "https://api.vk.com/method/video.get",
-        params={
-            "access_token": vk_token,
-            "v": req_version,
-            "videos": f"{owner_id}_{video_id}{'' if not access_key else f'_{access_key}'}",
-        },
-    )
+async def get_new_posts(
+    vk: VkClient,
+    vk_domain: str,
+    req_filter: str,
+    req_count: int,
+    last_known_id: int,
+    page_dates: Union[list, None] = None,
+) -> Union[list, None]:
+    """
+    Все посты новее last_known_id, от старых к новым.
+    Страницы запрашиваются, пока не встретится уже известный пост.
+    В page_dates добавляются даты всех полученных постов, в том числе уже известных.
+    """
+    req_count = min(req_count, VK_MAX_PAGE_SIZE)
+    posts: dict = {}
+    offset = 0
+    while True:
+        items = await get_data_from_vk(vk, vk_domain, req_filter, req_count, offset)
+        if items is None:
+            return None
 
-    def get_file_size(url: str) -> int:
-        response = requests.head(url)
-        return int(response.headers.get("Content-Length", 0))
+        if page_dates is not None:
+            page_dates.extend(item["date"] for item in items if "date" in item)
+        # Словарь убирает повторы, если между запросами на стене появились новые посты
+        for item in items:
+            if item["id"] > last_known_id:
+                posts[item["id"]] = item
 
-    def get_best_quality_url(files):
-        # Сортируем ключи по качеству (числовая часть после "mp4_")
-        mp4_keys = [key for key in files if key.startswith("mp4_")]
-        if not mp4_keys:
-            return None
+        # Закреплённый пост может быть старым и стоять в любом месте страницы
+        regular_ids = [item["id"] for item in items if not item.get("is_pinned")]
+        if len(items) < req_count or (regular_ids and min(regular_ids) <= last_known_id):
+            break
+        offset += len(items)
 
-        # Сортируем
-        mp4_keys.sort(key=lambda key: int(key.split("_")[1]), reverse=True)
-        index = 0
-        while index < len(mp4_keys) - 1 and get_file_size(files[mp4_keys[index]]) > 20000000:
-            index += 1
+    return [posts[post_id] for post_id in sorted(posts)]
 
-        if get_file_size(files[mp4_keys[index]]) > 20000000:
-            logger.info(f"The video was skipped due to its size exceeding the 20MB limit: {files[mp4_keys[index]]}")
-            return None
-        best_quality_key = mp4_keys[index]
-        logger.info(f"Best quality key: {best_quality_key}")
-        return files[best_quality_key]
-
-    logger.info(f"{owner_id}_{video_id}{'' if not access_key else f'_{access_key}'}")
-    data = response.json()
-    if "response" in data and data["response"]["items"]:
-        ext = get_best_quality_url(data["response"]["items"][0]["files"])
-        logger.info(f"Files:")
-        logger.info(json.dumps(data["response"]["items"][0]["files"], indent=4, ensure_ascii=False))
-        if not ext:
-            videos_urls.append(f"https://vk.com/video{owner_id}_{video_id}")
-        return ext
-    elif "error" in data:
-        logger.error(f"Error was detected when requesting data from VK: {data['error']['error_msg']}")
-    return ""
-
-
-def get_group_name(vk_token: str, req_version: float, owner_id) -> str:
-    response = requests.get(
-        "https://api.vk.com/method/groups.getById",
-        params={
-            "access_token": vk_token,
-            "v": req_version,
-            "group_id": owner_id,
-        },
+
+async def get_group_ids(vk: VkClient, vk_domains: List[str]) -> Dict[str, int]:
+    """ID сообществ по их адресам (короткое имя, clubN или publicN). Страницы пользователей пропускаются."""
+    try:
+        response = await vk.call("groups.getById", group_ids=",".join(vk_domains))
+    except VkApiError as e:
+        logger.error(f"Error was detected when requesting data from VK: {e.message}")
+        return {}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Got an error when requesting data from VK: {e}")
+        return {}
+
+    group_ids = {}
+    for group in response_items(response, "groups"):
+        for name in (group.get("screen_name"), f"club{group['id']}", f"public{group['id']}"):
+            if name:
+                group_ids[name] = group["id"]
+    return {vk_domain: group_ids[vk_domain] for vk_domain in vk_domains if vk_domain in group_ids}
+
+
+async def get_post_by_id(vk: VkClient, owner_id: int, post_id: int) -> Union[dict, None]:
+    """Запись стены по ID. None, если записи нет или VK ответил ошибкой."""
+    try:
+        response = await vk.call("wall.getById", posts=f"{owner_id}_{post_id}")
+    except VkApiError as e:
+        logger.error(f"Error was detected when requesting data from VK: {e.message}")
+        return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Got an error when requesting data from VK: {e}")
+        return None
+
+    items = response_items(response, "items")
+    return items[0] if items else None
+
+
+def matches_req_filter(item: dict, req_filter: str) -> bool:
+    """Попала бы запись в выдачу wall.get с этим фильтром: owner — записи владельца стены, others — чужие."""
+    if req_filter == "owner":
+        return item.get("from_id") == item.get("owner_id")
+    if req_filter == "others":
+        return item.get("from_id") != item.get("owner_id")
+    # Отложенные и предложенные записи в Callback API не приходят
+    return req_filter == "all"
+
+
+def get_video_key(video: dict) -> str:
+    return f"{video['owner_id']}_{video['id']}"
+
+
+async def get_post_metadata(vk: VkClient, item_parts: dict) -> Tuple[str, dict]:
+    """
+    Одним запросом execute получает название сообщества репоста
+    и файлы всех видео поста и репоста. Уже известное берётся из кэша.
+    """
+    videos = {
+        get_video_key(attachment["video"]): attachment["video"]
+        for item in item_parts.values()
+        for attachment in item.get("attachments", [])
+        if attachment["type"] == "video"
+    }
+    group_id = str(abs(item_parts["repost"]["owner_id"])) if "repost" in item_parts else None
+
+    videos_info = metadata_cache.get_many("video", list(videos))
+    group_names = metadata_cache.get_many("group", [group_id]) if group_id else {}
+    missing_videos = [video for key, video in videos.items() if key not in videos_info]
+    calls = []
+    if missing_videos:
+        video_ids = [
+            get_video_key(video) + (f"_{video['access_key']}" if video.get("access_key") else "")
+            for video in missing_videos
+        ]
+        calls.append(("video.get", {"videos": ",".join(video_ids)}))
+    if group_id and group_id not in group_names:
+        calls.append(("groups.getById", {"group_id": group_id}))
+
+    if calls:
+        try:
+            results = await vk.execute(calls)
+        except VkApiError as e:
+            logger.error(f"Error was detected when requesting data from VK: {e.message}")
+            results = None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Got an error when requesting data from VK: {e}")
+            results = None
+
+        if results is not None:
+            if missing_videos:
+                # Видео, которых нет в ответе, недоступны: они запоминаются как ошибки
+                video_response = results.pop(0)
+                received = {get_video_key(video): video for video in (video_response or {}).get("items", [])}
+                for key in (get_video_key(video) for video in missing_videos):
+                    metadata_cache.put("video", key, received.get(key), VIDEO_INFO_TTL)
+                    videos_info[key] = received.get(key)
+            if group_id and group_id not in group_names:
+                groups = response_items(results[0], "groups")
+                group_names[group_id] = groups[0]["name"] if groups else None
+                metadata_cache.put("group", group_id, group_names[group_id], GROUP_NAME_TTL)
+
+    videos_info = {key: video for key, video in videos_info.items() if video}
+    return (group_names.get(group_id) or "") if group_id else "", videos_info
+
+
+async def get_video_url(session: aiohttp.ClientSession, video_info: Union[dict, None], videos_urls: list) -> str:
+    if not video_info:
+        return ""
+
+    owner_id, video_id = video_info["owner_id"], video_info["id"]
+    files = video_info.get("files", {})
+    # Дамп файлов собирается, только если какой-то обработчик логов принимает DEBUG
+    videos_logger.opt(lazy=True).debug(
+        "Files of the video {}: {}", lambda: f"{owner_id}_{video_id}", lambda: json.dumps(files, ensure_ascii=False)
     )
-    data = response.json()
-    if "response" in data:
-        return data["response"][0]["name"]
-    elif "error" in data:
-        logger.error(f"Error was detected when requesting data from VK: {data['error']['error_msg']}")
-    return ""
+    ext = await choose_video_url(session, files, video_info.get("duration", 0))
+    if not ext:
+        videos_urls.append(f"https://vk.com/video{owner_id}_{video_id}")
+    return ext
@@ -0,0 +1,114 @@
+import csv
+import os
+import re
+import time
+from bisect import bisect_left
+from typing import Tuple, Union
+
+from loguru import logger
+
+# Ник "0" в authors.csv: упоминание автора остаётся текстом без ссылки
+NO_LINK = "0"
+VK_DOMAIN_PATTERN = re.compile(r"[\w.]+")
+TG_HANDLE_PATTERN = re.compile(r"\w+")
+# Сколько ошибочных строк файла выводить в лог при загрузке
+MAX_LOGGED_ERRORS = 10
+
+
+class AuthorRegistry:
+    """
+    Соответствие авторов VK и их ников в Telegram из authors.csv (строки вида "id1,nickname").
+
+    Файл перечитывается, только если изменились его время модификации или размер,
+    и не чаще раза в `check_interval` секунд. Записи хранятся в двух отсортированных
+    кортежах строк без хэш-таблицы, поиск — двоичный.
+    """
+
+    def __init__(self, path: str = "authors.csv", check_interval: float = 10):
+        self.path = path
+        self.check_interval = check_interval
+        self.domains: Tuple[str, ...] = ()
+        self.handles: Tuple[str, ...] = ()
+        self.file_state: Union[Tuple[int, int], None] = None
+        self.checked_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.invalid_rows = 0
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def get(self, domain: str) -> Union[str, None]:
+        """Ник в Telegram для автора VK, NO_LINK или None, если автора нет в файле."""
+        self.refresh()
+        index = bisect_left(self.domains, domain)
+        if index < len(self.domains) and self.domains[index] == domain:
+            self.hits += 1
+            return self.handles[index]
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "authors": len(self.domains),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "invalid_rows": self.invalid_rows,
+        }
+
+    def refresh(self, force: bool = False) -> None:
+        """Перечитывает файл, если он изменился с прошлой загрузки."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.file_state is not None or not self.reloads:
+                logger.warning(f"Authors file {self.path} is not found. Author links won't be replaced.")
+                self.domains, self.handles, self.file_state = (), (), None
+                self.reloads += 1
+            return
+
+        file_state = (stat.st_mtime_ns, stat.st_size)
+        if file_state == self.file_state:
+            return
+        try:
+            self._load()
+        except (OSError, UnicodeDecodeError, csv.Error) as ex:
+            # Остаётся прежний список, файл будет прочитан при следующем изменении
+            logger.error(f"Failed to read authors file {self.path}: {ex!r}")
+        self.file_state = file_state
+        self.reloads += 1
+
+    def _load(self) -> None:
+        authors = {}
+        invalid_rows = 0
+        with open(self.path, "r", encoding="utf-8", newline="") as file:
+            for row in csv.reader(file):
+                row = [value.strip() for value in row]
+                while row and not row[-1]:
+                    row.pop()
+                if not row:
+                    continue
+                domain, handle = row[0], row[-1].lstrip("@")
+                if (
+                    len(row) != 2
+                    or not VK_DOMAIN_PATTERN.fullmatch(domain)
+                    or not TG_HANDLE_PATTERN.fullmatch(handle)
+                ):
+                    invalid_rows += 1
+                    if invalid_rows <= MAX_LOGGED_ERRORS:
+                        logger.warning(f"Invalid row {row} in {self.path}: expected 'vk_id,telegram_nickname'.")
+                    continue
+                authors[domain] = handle
+
+        domains = sorted(authors)
+        self.domains = tuple(domains)
+        self.handles = tuple(authors[domain] for domain in domains)
+        self.invalid_rows = invalid_rows
+        logger.info(f"Loaded {len(self.domains)} authors from {self.path}. Invalid rows skipped: {invalid_rows}.")
@@ -0,0 +1,100 @@
+import asyncio
+import hmac
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Set
+
+from aiohttp import web
+from loguru import logger
+
+from routes import Source
+
+# Пересылаются только опубликованные записи: предложенные и отложенные пропускаются
+POST_TYPES = ("post", "copy")
+# Сколько последних event_id помнить: VK повторяет событие, если не получил ответ вовремя
+SEEN_EVENTS_SIZE = 1000
+
+
+class CallbackServer:
+    """
+    HTTP-сервер для событий VK Callback API.
+
+    Отвечает на запрос подтверждения сервера, проверяет секретный ключ и передаёт
+    в `handler` ID сообщества и новой записи стены. Содержимому события сервер не доверяет:
+    запись заново запрашивается у VK. VK ждёт ответ "ok" не дольше нескольких секунд,
+    поэтому пост обрабатывается в фоне уже после ответа.
+    """
+
+    def __init__(
+        self,
+        sources: Dict[int, List[Source]],
+        handler: Callable[[Source, int, int], Awaitable[None]],
+        secret: str,
+        path: str = "/",
+    ):
+        # Без ключа события мог бы присылать кто угодно, кто знает адрес сервера и ID сообщества
+        if not secret:
+            raise ValueError("Callback API secret is required.")
+        self.sources = sources
+        self.handler = handler
+        self.secret = secret
+        self.path = path
+        self.seen_events: OrderedDict = OrderedDict()
+        self.tasks: Set[asyncio.Task] = set()
+        self.runner: web.AppRunner = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        self.runner = web.AppRunner(self.make_app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Callback API server is listening on {host}:{port}{self.path}.")
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        try:
+            event = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="bad request")
+
+        group_id = event.get("group_id")
+        sources = self.sources.get(group_id)
+        if not sources:
+            logger.warning(f"Callback event for unknown group {group_id} was ignored.")
+            return web.Response(status=404, text="unknown group")
+        if not hmac.compare_digest(str(event.get("secret", "")), self.secret):
+            logger.warning(f"Callback event for group {event.get('group_id')} with a wrong secret was rejected.")
+            return web.Response(status=403, text="wrong secret")
+
+        if event.get("type") == "confirmation":
+            return web.Response(text=sources[0].callback_confirmation)
+        if event.get("type") != "wall_post_new" or self._is_seen(event.get("event_id")):
+            return web.Response(text="ok")
+
+        item = event.get("object") or {}
+        if item.get("post_type", "post") not in POST_TYPES or not isinstance(item.get("id"), int):
+            return web.Response(text="ok")
+        for source in sources:
+            task = asyncio.create_task(self.handler(source, group_id, item["id"]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return web.Response(text="ok")
+
+    def _is_seen(self, event_id: str) -> bool:
+        if not event_id:
+            return False
+        if event_id in self.seen_events:
+            return True
+        self.seen_events[event_id] = True
+        if len(self.seen_events) > SEEN_EVENTS_SIZE:
+            self.seen_events.popitem(last=False)
+        return False
@@ -10,16 +10,112 @@ TG_CHANNEL: str = os.getenv("VAR_TG_CHANNEL", "")
 TG_BOT_TOKEN: str = os.getenv("VAR_TG_BOT_TOKEN", "")
 VK_TOKEN: str = os.getenv("VAR_VK_TOKEN", "")
 VK_DOMAIN: str = os.getenv("VAR_VK_DOMAIN", "")
+# Адреса VK API и Telegram Bot API. Меняются для локального Bot API сервера или тестов с benchmarks/fake_api.py
+VK_API_URL: str = os.getenv("VAR_VK_API_URL", "https://api.vk.com/method/")
+TG_API_URL: str = os.getenv("VAR_TG_API_URL", "https://api.telegram.org")
 
 REQ_VERSION: float = float(os.getenv("VAR_REQ_VERSION", 5.103))
-REQ_COUNT: int = int(os.getenv("VAR_REQ_COUNT", 3))
+REQ_COUNT: int = int(os.getenv("VAR_REQ_COUNT", 100))
 REQ_FILTER: str = os.getenv("VAR_REQ_FILTER", "owner")
+# Не больше N запросов к VK API в секунду (ограничение VK — 3)
+VK_RATE_LIMIT: int = int(os.getenv("VAR_VK_RATE_LIMIT", 3))
+# Сколько вложений поста загружается одновременно
+ATTACHMENTS_CONCURRENCY: int = int(os.getenv("VAR_ATTACHMENTS_CONCURRENCY", 8))
+# Фото берётся в лучшем размере, но не больше PHOTO_MAX_SIDE пикселей по длинной стороне
+# и не тяжелее примерно PHOTO_MAX_BYTES байт (0 — без ограничения)
+PHOTO_MAX_SIDE: int = int(os.getenv("VAR_PHOTO_MAX_SIDE", 0))
+PHOTO_MAX_BYTES: int = int(os.getenv("VAR_PHOTO_MAX_BYTES", 0))
+# Кэш названий сообществ и файлов видео из VK: время жизни записей в секундах и размер в памяти.
+# Ссылки на файлы видео со временем перестают работать, поэтому видео хранятся недолго
+VK_CACHE_PATH: str = os.getenv("VAR_VK_CACHE_PATH", "./data/vk_cache.sqlite3")
+VK_CACHE_SIZE: int = int(os.getenv("VAR_VK_CACHE_SIZE", 5000))
+GROUP_NAME_TTL: int = int(os.getenv("VAR_GROUP_NAME_TTL", 86400))
+VIDEO_INFO_TTL: int = int(os.getenv("VAR_VIDEO_INFO_TTL", 1800))
+# Ошибки VK и недоступные видео запоминаются на это время
+VK_CACHE_NEGATIVE_TTL: int = int(os.getenv("VAR_VK_CACHE_NEGATIVE_TTL", 300))
+# Сколько постов разбирается заранее, пока предыдущие отправляются в Telegram
+PIPELINE_DEPTH: int = int(os.getenv("VAR_PIPELINE_DEPTH", 3))
+# Квота на временные файлы источника на диске и размер документов, которые держатся в памяти
+TEMP_QUOTA_MB: int = int(os.getenv("VAR_TEMP_QUOTA_MB", 500))
+TEMP_SPOOL_KB: int = int(os.getenv("VAR_TEMP_SPOOL_KB", 1024))
+
+# Лимиты Telegram: сообщений в секунду на бота и сообщений в минуту на канал
+TG_GLOBAL_RATE: float = float(os.getenv("VAR_TG_GLOBAL_RATE", 30))
+TG_CHAT_RATE: float = float(os.getenv("VAR_TG_CHAT_RATE", 20))
+# Сколько раз повторяется запрос к Telegram после временной ошибки
+TG_MAX_TRIES: int = int(os.getenv("VAR_TG_MAX_TRIES", 5))
 
 SINGLE_START: bool = os.getenv("VAR_SINGLE_START", "").lower() in ("true",)
 TIME_TO_SLEEP: int = int(os.getenv("VAR_TIME_TO_SLEEP", 120))
+# Интервал опроса подстраивается под часы, в которые выходят посты, в пределах от минимума до максимума
+# (в секундах). TIME_TO_SLEEP и interval маршрута — интервал для часов со средней частотой постов
+ADAPTIVE_POLLING: bool = os.getenv("VAR_ADAPTIVE_POLLING", "true").lower() in ("true",)
+POLL_MIN_INTERVAL: int = int(os.getenv("VAR_POLL_MIN_INTERVAL", 60))
+POLL_MAX_INTERVAL: int = int(os.getenv("VAR_POLL_MAX_INTERVAL", 1800))
+# Случайный разброс интервала (доля), чтобы опросы разных стен не совпадали
+POLL_JITTER: float = float(os.getenv("VAR_POLL_JITTER", 0.1))
 SKIP_ADS_POSTS: bool = os.getenv("VAR_SKIP_ADS_POSTS", "").lower() in ("true",)
 SKIP_COPYRIGHTED_POST: bool = os.getenv("VAR_SKIP_COPYRIGHTED_POST", "").lower() in ("true")
 SKIP_REPOSTS: bool = os.getenv("VAR_SKIP_REPOSTS", "").lower() in ("true")
 
+# Файл маршрутов: несколько стен VK и каналов Telegram в одном процессе.
+# Если файла нет, используются VAR_VK_DOMAIN и VAR_TG_CHANNEL.
+ROUTES_FILE: str = os.getenv("VAR_ROUTES_FILE", "./routes.json")
+
+# Приём новых постов через VK Callback API: бот сам поднимает HTTP-сервер для событий VK
+CALLBACK_ENABLED: bool = os.getenv("VAR_CALLBACK_ENABLED", "").lower() in ("true",)
+CALLBACK_HOST: str = os.getenv("VAR_CALLBACK_HOST", "0.0.0.0")
+CALLBACK_PORT: int = int(os.getenv("VAR_CALLBACK_PORT", 8080))
+CALLBACK_PATH: str = os.getenv("VAR_CALLBACK_PATH", "/vk/callback")
+CALLBACK_SECRET: str = os.getenv("VAR_CALLBACK_SECRET", "")
+CALLBACK_CONFIRMATION: str = os.getenv("VAR_CALLBACK_CONFIRMATION", "")
+# Интервал опроса стены при работающем Callback API: опрос только подбирает пропущенные события
+CALLBACK_POLL_INTERVAL: int = int(os.getenv("VAR_CALLBACK_POLL_INTERVAL", 1800))
+
+# Уровень логов. На DEBUG в лог попадают подробности разбора каждого поста
+LOG_LEVEL: str = os.getenv("VAR_LOG_LEVEL", "INFO").upper()
+# Формат логов: text или json (одна запись JSON на строку, с ID поста и прочими полями в extra)
+LOG_FORMAT: str = os.getenv("VAR_LOG_FORMAT", "text").lower()
+# Частые отладочные сообщения (ссылки, видео, временные файлы) пишутся не чаще LOG_SAMPLE_RATE в секунду
+# на каждый вид сообщений, остальные отбрасываются. 0 — без ограничения
+LOG_SAMPLE_RATE: float = float(os.getenv("VAR_LOG_SAMPLE_RATE", 5))
+# Метрики в формате Prometheus по адресу http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED: bool = os.getenv("VAR_METRICS_ENABLED", "").lower() in ("true",)
+METRICS_HOST: str = os.getenv("VAR_METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("VAR_METRICS_PORT", 9108))
+
+# Несколько процессов-обработчиков: источники делятся между ними через общую базу аренд LEASES_PATH.
+# WORKERS — число процессов. WORKER_MODE включает аренды и для одного процесса, когда на машине
+# запущено несколько экземпляров бота с общими базами. Базы SQLite в режиме WAL должны лежать
+# на локальном диске: по сетевой файловой системе их делить нельзя
+WORKERS: int = int(os.getenv("VAR_WORKERS", 1))
+WORKER_MODE: bool = os.getenv("VAR_WORKER_MODE", "").lower() in ("true",) or WORKERS > 1
+LEASES_PATH: str = os.getenv("VAR_LEASES_PATH", "./data/leases.sqlite3")
+# Через сколько секунд без продления аренда источника истекает и его забирает другой процесс
+LEASE_TTL: int = int(os.getenv("VAR_LEASE_TTL", 60))
+
+# Журнал доставки постов
+JOURNAL_PATH: str = os.getenv("VAR_JOURNAL_PATH", "./data/journal.sqlite3")
+# После стольких неудачных циклов отправки пост пропускается
+MAX_DELIVERY_ATTEMPTS: int = int(os.getenv("VAR_MAX_DELIVERY_ATTEMPTS", 3))
+
+# Кэш file_id загруженных в Telegram медиа и его размер (число записей)
+FILE_ID_CACHE_PATH: str = os.getenv("VAR_FILE_ID_CACHE_PATH", "./data/file_ids.sqlite3")
+FILE_ID_CACHE_SIZE: int = int(os.getenv("VAR_FILE_ID_CACHE_SIZE", 50000))
+
+# Репост того, что уже опубликовано в канале, заменяется ссылкой, а повторный пост пропускается.
+# Журнал помнит до DEDUP_MAX_ENTRIES опубликованных записей, последние DEDUP_CACHE_SIZE проверок — в памяти
+DEDUP_ENABLED: bool = os.getenv("VAR_DEDUP_ENABLED", "true").lower() in ("true",)
+DEDUP_CACHE_SIZE: int = int(os.getenv("VAR_DEDUP_CACHE_SIZE", 10000))
+DEDUP_MAX_ENTRIES: int = int(os.getenv("VAR_DEDUP_MAX_ENTRIES", 200000))
+
 WHITELIST: list = json.loads(os.getenv("VAR_WHITELIST", "[]"))
 BLACKLIST: list = json.loads(os.getenv("VAR_BLACKLIST", "[]"))
+# Как искать слова из списков: substring, word или hashtag (см. keyword_filter.py)
+KEYWORDS_MODE: str = os.getenv("VAR_KEYWORDS_MODE", "substring")
+
+# CSV с никами авторов в Telegram: "id VK,ник" (ник 0 — упоминание без ссылки)
+AUTHORS_FILE: str = os.getenv("VAR_AUTHORS_FILE", "./authors.csv")
+
+# Замены подстрок в тексте постов: {"что заменить": "на что заменить"}
+TEXT_REPLACEMENTS: dict = json.loads(os.getenv("VAR_TEXT_REPLACEMENTS", '{"@jrpg.wiki": "@jrpg_wiki"}'))
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import time
+from typing import List, Union
+
+from aiogram import types
+from loguru import logger
+
+
+def get_file_id(message: types.Message) -> Union[str, None]:
+    """file_id медиа из сообщения, которое вернул Telegram."""
+    if message.photo:
+        return message.photo[-1].file_id
+    for media in (message.video, message.document, message.animation):
+        if media:
+            return media.file_id
+    return None
+
+
+class FileIdCache:
+    """
+    Постоянный кэш file_id, которые Telegram вернул за отправленные медиа.
+
+    Ключ — ID медиа в VK (например, photo-1_456). Повторная отправка того же
+    медиа по file_id не требует ни скачивания, ни загрузки файла.
+    Когда записей становится больше `max_entries`, удаляются давно не использованные.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS file_ids_last_used ON file_ids (last_used)")
+
+    def close(self) -> None:
+        self.db.close()
+
+    def get(self, key: str) -> Union[str, None]:
+        row = self.db.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        self.db.execute("UPDATE file_ids SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def remember(self, keys: List[str], messages: List[types.Message]) -> None:
+        """Сохраняет file_id медиа из ответа sendMediaGroup. Ключи идут в том же порядке, что и медиа."""
+        rows = [
+            (key, file_id, time.time())
+            for key, message in zip(keys, messages)
+            if key and (file_id := get_file_id(message))
+        ]
+        if not rows:
+            return
+        self.db.executemany(
+            "INSERT INTO file_ids (key, file_id, last_used) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET file_id = excluded.file_id, last_used = excluded.last_used",
+            rows,
+        )
+        self.evict()
+
+    def forget(self, keys: List[str]) -> None:
+        """Удаляет file_id, которые Telegram больше не принимает."""
+        self.db.executemany("DELETE FROM file_ids WHERE key = ?", [(key,) for key in keys])
+
+    def evict(self) -> None:
+        evicted = self.db.execute(
+            "DELETE FROM file_ids WHERE key IN "
+            "(SELECT key FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if evicted:
+            logger.info(f"{evicted} old file_ids were evicted from the cache.")
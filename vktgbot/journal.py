@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import List, Union
+
+from loguru import logger
+
+# Статусы частей поста (пост или репост) в журнале
+SENT = "sent"
+FAILED = "failed"
+ABANDONED = "abandoned"
+
+# Доля записей contents, которая удаляется сверх лимита за раз, чтобы не чистить таблицу при каждой отправке
+CONTENTS_EVICT_HEADROOM = 0.1
+
+
+class Journal:
+    """
+    Журнал доставки постов на SQLite.
+
+    Хранит последний обработанный пост каждого источника и статус
+    каждой части поста, чтобы после падения продолжить ровно с того места,
+    где бот остановился, без повторной отправки и без потерь.
+
+    Ещё журнал помнит, какое содержимое уже опубликовано в каждом канале (см. tools.content_keys),
+    и ID первого сообщения с ним. Последние `cache_size` проверок держатся в памяти, в базе —
+    не больше `max_contents` записей, давно опубликованные удаляются. Если в журнал пишут
+    несколько процессов, отсутствие содержимого в памяти не запоминается (`cache_misses`).
+    """
+
+    def __init__(self, path: str, cache_size: int = 10000, max_contents: int = 200000, cache_misses: bool = True):
+        self.cache_size = cache_size
+        self.cache_misses = cache_misses
+        self.max_contents = max_contents
+        # (канал, ключ) -> ID сообщения или None, если такого содержимого в канале не было
+        self.contents: "OrderedDict[tuple, Union[int, None]]" = OrderedDict()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, isolation_level=None)
+        # WAL: каждая запись — одно дописывание в лог, атомарно и без переписывания файла
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL,
+                checked_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                source TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                post_id INTEGER NOT NULL,
+                part TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (source, channel, post_id, part)
+            );
+            CREATE TABLE IF NOT EXISTS contents (
+                channel TEXT NOT NULL,
+                key TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                delivered_at REAL NOT NULL,
+                PRIMARY KEY (channel, key)
+            );
+            CREATE INDEX IF NOT EXISTS contents_delivered_at ON contents (delivered_at);
+            CREATE TABLE IF NOT EXISTS poll_profiles (
+                source TEXT PRIMARY KEY,
+                profile TEXT NOT NULL
+            );
+            """
+        )
+        # Число записей contents, пересчитывается перед удалением старых
+        self.contents_count = self.db.execute("SELECT COUNT(*) FROM contents").fetchone()[0]
+
+    def close(self) -> None:
+        self.db.close()
+
+    def get_last_id(self, source: str) -> Union[int, None]:
+        row = self.db.execute("SELECT last_id FROM sources WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def set_last_id(self, source: str, last_id: int) -> None:
+        self.db.execute(
+            "INSERT INTO sources (source, last_id) VALUES (?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET last_id = excluded.last_id",
+            (source, last_id),
+        )
+        logger.info(f"New ID, written in the journal: {last_id}")
+
+    def write_check_time(self, source: str) -> None:
+        self.db.execute("UPDATE sources SET checked_at = ? WHERE source = ?", (time.time(), source))
+
+    def get_poll_profile(self, source: str) -> Union[dict, None]:
+        """Профиль частоты постов стены для адаптивного опроса (см. polling.AdaptiveInterval)."""
+        row = self.db.execute("SELECT profile FROM poll_profiles WHERE source = ?", (source,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_poll_profile(self, source: str, profile: dict) -> None:
+        self.db.execute(
+            "INSERT INTO poll_profiles (source, profile) VALUES (?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET profile = excluded.profile",
+            (source, json.dumps(profile)),
+        )
+
+    def get_status(self, source: str, channel: str, post_id: int, part: str) -> Union[str, None]:
+        row = self.db.execute(
+            "SELECT status FROM deliveries WHERE source = ? AND channel = ? AND post_id = ? AND part = ?",
+            (source, channel, post_id, part),
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark(self, source: str, channel: str, post_id: int, part: str, status: str) -> int:
+        """Записывает статус части поста и возвращает число попыток её отправки."""
+        self.db.execute(
+            "INSERT INTO deliveries (source, channel, post_id, part, status, attempts, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT (source, channel, post_id, part) DO UPDATE SET "
+            "status = excluded.status, attempts = attempts + 1, updated_at = excluded.updated_at",
+            (source, channel, post_id, part, status, time.time()),
+        )
+        return self.db.execute(
+            "SELECT attempts FROM deliveries WHERE source = ? AND channel = ? AND post_id = ? AND part = ?",
+            (source, channel, post_id, part),
+        ).fetchone()[0]
+
+    def find_content(self, channel: str, keys: List[str]) -> Union[int, None]:
+        """ID сообщения, с которым содержимое с одним из ключей уже опубликовано в канале."""
+        for key in keys:
+            cache_key = (channel, key)
+            if cache_key in self.contents:
+                self.contents.move_to_end(cache_key)
+                message_id = self.contents[cache_key]
+            else:
+                row = self.db.execute(
+                    "SELECT message_id FROM contents WHERE channel = ? AND key = ?", (channel, key)
+                ).fetchone()
+                message_id = row[0] if row else None
+                if message_id is not None or self.cache_misses:
+                    self._cache_content(cache_key, message_id)
+            if message_id is not None:
+                return message_id
+        return None
+
+    def remember_content(self, channel: str, keys: List[str], message_id: int) -> None:
+        now = time.time()
+        self.contents_count += self.db.executemany(
+            "INSERT INTO contents (channel, key, message_id, delivered_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (channel, key) DO NOTHING",
+            [(channel, key, message_id, now) for key in keys],
+        ).rowcount
+        for key in keys:
+            if self.contents.get((channel, key)) is None:
+                self._cache_content((channel, key), message_id)
+        if self.contents_count > self.max_contents:
+            self._evict_contents()
+
+    def _evict_contents(self) -> None:
+        """Удаляет самые старые ключи с запасом CONTENTS_EVICT_HEADROOM и только их убирает из памяти."""
+        # В общую базу пишут и другие процессы, поэтому перед удалением число записей уточняется
+        self.contents_count = self.db.execute("SELECT COUNT(*) FROM contents").fetchone()[0]
+        if self.contents_count <= self.max_contents:
+            return
+        keep = int(self.max_contents * (1 - CONTENTS_EVICT_HEADROOM))
+        evicted = self.db.execute(
+            "DELETE FROM contents WHERE rowid IN "
+            "(SELECT rowid FROM contents ORDER BY delivered_at DESC LIMIT -1 OFFSET ?) "
+            "RETURNING channel, key",
+            (keep,),
+        ).fetchall()
+        for channel, key in evicted:
+            # Удалённые из базы ключи не должны находиться в памяти
+            self.contents.pop((channel, key), None)
+        self.contents_count -= len(evicted)
+        logger.info(f"{len(evicted)} old content keys were evicted from the journal.")
+
+    def _cache_content(self, cache_key: tuple, message_id: Union[int, None]) -> None:
+        self.contents[cache_key] = message_id
+        self.contents.move_to_end(cache_key)
+        if len(self.contents) > self.cache_size:
+            self.contents.popitem(last=False)
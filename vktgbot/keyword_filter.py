@@ -0,0 +1,107 @@
+from collections import deque
+from typing import Dict, List, Union
+
+# Режимы поиска слов из белого и чёрного списков:
+# substring — слово может быть частью другого слова (как раньше),
+# word — слово должно стоять отдельно, как \b в регулярных выражениях,
+# hashtag — то же, но # считается частью слова: "#music" не найдётся в "#musicvideo" и "x#music",
+# а "music" — в "#music" (в режиме word найдётся)
+MODES = ("substring", "word", "hashtag")
+# Короткие списки быстрее проверить встроенным str.find по каждому слову:
+# проход автомата по тексту на Python дороже, пока слов меньше нескольких сотен
+SCAN_LIST_SIZE = 300
+
+
+class KeywordMatcher:
+    """
+    Поиск любого из множества слов в тексте за один проход (алгоритм Ахо — Корасик).
+
+    Автомат строится один раз, а проверка поста не зависит от числа слов в списке,
+    поэтому списки могут содержать тысячи фраз и хэштегов. Регистр не учитывается.
+    Списки короче SCAN_LIST_SIZE проверяются поиском каждого слова по отдельности.
+    """
+
+    def __init__(self, words: List[str], mode: str = "substring"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown keywords mode: {mode}. Expected one of: {', '.join(MODES)}")
+        self.mode = mode
+        self.words = [word for word in words if word]
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Для каждого состояния — индексы слов, которые в нём заканчиваются
+        self.output: List[List[int]] = [[]]
+        self.terms = [word.lower() for word in self.words]
+        if len(self.terms) >= SCAN_LIST_SIZE:
+            for index, term in enumerate(self.terms):
+                self._add(term, index)
+            self._link()
+
+    def __bool__(self) -> bool:
+        return bool(self.words)
+
+    def _add(self, term: str, index: int) -> None:
+        node = 0
+        for char in term:
+            if char not in self.goto[node]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][char] = len(self.goto) - 1
+            node = self.goto[node][char]
+        self.output[node].append(index)
+
+    def _link(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def _is_word_char(self, char: str) -> bool:
+        return char.isalnum() or char == "_" or (char == "#" and self.mode == "hashtag")
+
+    def _is_bounded(self, text: str, start: int, end: int) -> bool:
+        if self.mode == "substring":
+            return True
+        term = text[start:end]
+        if self._is_word_char(term[0]) and start > 0 and self._is_word_char(text[start - 1]):
+            return False
+        if self._is_word_char(term[-1]) and end < len(text) and self._is_word_char(text[end]):
+            return False
+        return True
+
+    def find(self, text: str) -> Union[str, None]:
+        """Первое найденное в тексте слово из списка или None."""
+        if not self.words:
+            return None
+
+        text = text.lower()
+        if len(self.terms) < SCAN_LIST_SIZE:
+            return self._scan(text)
+
+        goto, fail, output = self.goto, self.fail, self.output
+        root = goto[0]
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0) if node else root.get(char, 0)
+            for index in output[node]:
+                end = position + 1
+                if self._is_bounded(text, end - len(self.terms[index]), end):
+                    return self.words[index]
+        return None
+
+    def _scan(self, text: str) -> Union[str, None]:
+        for index, term in enumerate(self.terms):
+            start = text.find(term)
+            while start != -1:
+                if self._is_bounded(text, start, start + len(term)):
+                    return self.words[index]
+                start = text.find(term, start + 1)
+        return None
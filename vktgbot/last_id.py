@@ -1,24 +1,26 @@
 import datetime
+import os
 
 from loguru import logger
 
 
 def read_id() -> int:
+    """ID последнего поста из last_id.txt. Нужен только при первом запуске, дальше ID хранится в журнале."""
     try:
         return int(open("./last_id.txt", "r").read())
-    except ValueError:
+    except (ValueError, FileNotFoundError):
         logger.critical(
             "The value of the last identifier is incorrect. Please check the contents of the file 'last_id.txt'."
         )
         exit()
 
 
-def write_id(new_id: int) -> None:
-    open("./last_id.txt", "w").write(str(new_id))
-    logger.info(f"New ID, written in the file: {new_id}")
-
-
 def write_time() -> None:
     time = datetime.datetime.now()
-    open("./last_check.txt", "w+").write(str(time))
+    # Пишем во временный файл и атомарно подменяем старый
+    with open("./last_check.txt.tmp", "w") as file:
+        file.write(str(time))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace("./last_check.txt.tmp", "./last_check.txt")
     logger.info(f"New time, written in the file: {time}")
@@ -0,0 +1,93 @@
+import math
+import os
+import sqlite3
+import time
+from typing import Iterable, Set
+
+from loguru import logger
+
+
+class LeaseStore:
+    """
+    Аренда источников в общей базе SQLite для нескольких процессов одной машины.
+    База должна лежать на локальном диске: блокировки SQLite в режиме WAL
+    на сетевых файловых системах не работают.
+
+    У каждого источника не больше одного владельца: аренда выдаётся на `ttl` секунд
+    и продлевается, пока процесс жив. Если процесс умер или завис, его аренды истекают
+    и источники забирают другие процессы. Процессы отмечаются в таблице workers,
+    по ней каждый считает свою долю источников.
+    """
+
+    def __init__(self, path: str, owner: str, ttl: float = 60):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.owner = owner
+        self.ttl = ttl
+        # Запись в SQLite из нескольких процессов идёт по очереди, ожидание блокировки — до 30 секунд
+        self.db = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                source TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                owner TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        """Отпускает все аренды процесса, чтобы другие забрали источники сразу."""
+        self.db.execute("UPDATE leases SET expires_at = 0 WHERE owner = ?", (self.owner,))
+        self.db.execute("DELETE FROM workers WHERE owner = ?", (self.owner,))
+        self.db.close()
+
+    def heartbeat(self) -> None:
+        now = time.time()
+        self.db.execute(
+            "INSERT INTO workers (owner, seen_at) VALUES (?, ?) ON CONFLICT (owner) DO UPDATE SET seen_at = ?",
+            (self.owner, now, now),
+        )
+        self.db.execute("DELETE FROM workers WHERE seen_at < ?", (now - 10 * self.ttl,))
+
+    def fair_share(self, sources_count: int) -> int:
+        """Сколько источников процессу брать себе: поровну между живыми процессами."""
+        workers = self.db.execute("SELECT COUNT(*) FROM workers WHERE seen_at >= ?", (time.time() - self.ttl,))
+        return math.ceil(sources_count / max(1, workers.fetchone()[0]))
+
+    def try_acquire(self, source: str) -> bool:
+        """Берёт источник, если он свободен, аренда истекла или уже принадлежит этому процессу."""
+        now = time.time()
+        acquired = self.db.execute(
+            "INSERT INTO leases (source, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+            (source, self.owner, now + self.ttl, now),
+        ).rowcount
+        if acquired:
+            logger.info(f"[{source}] Source lease is acquired by {self.owner}.")
+        return bool(acquired)
+
+    def renew(self, sources: Iterable[str]) -> Set[str]:
+        """Продлевает аренды и возвращает источники, которые всё ещё принадлежат процессу."""
+        sources = list(sources)
+        if not sources:
+            return set()
+        placeholders = ",".join("?" * len(sources))
+        self.db.execute(
+            f"UPDATE leases SET expires_at = ? WHERE owner = ? AND source IN ({placeholders})",
+            [time.time() + self.ttl, self.owner] + sources,
+        )
+        rows = self.db.execute(
+            f"SELECT source FROM leases WHERE owner = ? AND source IN ({placeholders})", [self.owner] + sources
+        )
+        return {row[0] for row in rows}
+
+    def release(self, source: str) -> None:
+        self.db.execute("UPDATE leases SET expires_at = 0 WHERE owner = ? AND source = ?", (self.owner, source))
+        logger.info(f"[{source}] Source lease is released by {self.owner}.")
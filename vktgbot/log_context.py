@@ -0,0 +1,80 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Tuple
+
+from loguru import logger
+
+from metrics import LOG_MESSAGES_DROPPED
+
+# Пост, с которым сейчас идёт работа. Попадает в каждую запись лога как extra["post"]
+CORRELATION_ID: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+TEXT_FORMAT = "{time} {level} {extra[post]} {message}"
+STDERR_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <magenta>{extra[post]}</magenta> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+# Отладочные сообщения, которые пишутся на каждую ссылку, видео или файл. Каждый канал прореживается отдельно
+links_logger = logger.bind(channel="links")
+videos_logger = logger.bind(channel="videos")
+temp_logger = logger.bind(channel="temp")
+
+
+def post_correlation_id(source_name: str, post_id: int) -> str:
+    return f"{source_name}:{post_id}"
+
+
+@contextmanager
+def correlation(correlation_id: str) -> Iterator[None]:
+    """Записи лога внутри блока, в том числе из задач, созданных в нём, получают этот ID."""
+    token = CORRELATION_ID.set(correlation_id)
+    try:
+        yield
+    finally:
+        CORRELATION_ID.reset(token)
+
+
+class LogSampler:
+    """
+    Патчер записей loguru: добавляет ID поста и прореживает частые сообщения.
+
+    Сообщения, записанные через logger.bind(channel=...), проходят не чаще `rate` в секунду
+    на канал, со всплесками до `burst`. Лишние помечаются и отбрасываются фильтром keep_record,
+    а первое сообщение канала после них сообщает, сколько сообщений было отброшено.
+    Патчер вызывается только для записей, которые принимает хотя бы один обработчик.
+    """
+
+    def __init__(self, rate: float, burst: float = 0):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        # канал -> (доступные сообщения, время обновления)
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.dropped: Dict[str, int] = {}
+
+    def __call__(self, record: dict) -> None:
+        extra = record["extra"]
+        extra.setdefault("post", CORRELATION_ID.get())
+        channel = extra.get("channel")
+        if channel is None or self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(channel, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.buckets[channel] = (tokens, now)
+            self.dropped[channel] = self.dropped.get(channel, 0) + 1
+            extra["sampled_out"] = True
+            LOG_MESSAGES_DROPPED.inc(channel=channel)
+            return
+        self.buckets[channel] = (tokens - 1, now)
+        dropped = self.dropped.pop(channel, 0)
+        if dropped:
+            extra["dropped"] = dropped
+            record["message"] += f" ({dropped} more {channel} messages were dropped)"
+
+
+def keep_record(record: dict) -> bool:
+    return not record["extra"].get("sampled_out")
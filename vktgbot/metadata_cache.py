@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple, Union
+
+from loguru import logger
+
+from metrics import VK_CACHE_LOOKUPS
+
+# Ответ VK, которого не было: ошибка или недоступное видео
+NEGATIVE = "negative"
+HIT = "hit"
+MISS = "miss"
+# Раз в столько записей из базы удаляются устаревшие
+PURGE_EVERY = 1000
+
+
+class MetadataCache:
+    """
+    Кэш ответов VK о сообществах и видео с временем жизни записей.
+
+    Последние `memory_size` записей держатся в памяти, все — в SQLite, поэтому кэш
+    переживает перезапуск. Ошибки VK тоже запоминаются (значение None), но на меньшее
+    время: недоступное видео не запрашивается заново в каждом цикле.
+    База открывается при первом обращении.
+    """
+
+    def __init__(self, path: str, memory_size: int = 5000, negative_ttl: float = 300):
+        self.path = path
+        self.memory_size = memory_size
+        self.negative_ttl = negative_ttl
+        # ключ -> (значение, время истечения)
+        self.memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self.db: Union[sqlite3.Connection, None] = None
+        self.counts = {HIT: 0, NEGATIVE: 0, MISS: 0}
+        self.puts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.db = sqlite3.connect(self.path, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT, expires_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS metadata_expires_at ON metadata (expires_at)")
+            self.purge()
+        return self.db
+
+    def purge(self) -> None:
+        removed = self._connect().execute("DELETE FROM metadata WHERE expires_at < ?", (time.time(),)).rowcount
+        if removed:
+            logger.info(f"{removed} expired VK metadata entries were removed from the cache.")
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def get_many(self, kind: str, keys: List[str]) -> Dict[str, Any]:
+        """Значения из кэша по ключам одного вида (group, video). Ключей без записи в ответе нет."""
+        now = time.time()
+        found = {}
+        for key in keys:
+            cache_key = f"{kind}:{key}"
+            entry = self.memory.get(cache_key)
+            if entry is None:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM metadata WHERE key = ?", (cache_key,)
+                ).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(cache_key, entry)
+            else:
+                self.memory.move_to_end(cache_key)
+
+            if entry is None or entry[1] < now:
+                result = MISS
+            else:
+                result = HIT if entry[0] is not None else NEGATIVE
+                found[key] = entry[0]
+            self.counts[result] += 1
+            VK_CACHE_LOOKUPS.inc(kind=kind, result=result)
+        return found
+
+    def put(self, kind: str, key: str, value: Any, ttl: float) -> None:
+        """Сохраняет ответ VK. None — ошибка, она хранится negative_ttl секунд."""
+        cache_key = f"{kind}:{key}"
+        entry = (value, time.time() + (ttl if value is not None else self.negative_ttl))
+        self._remember(cache_key, entry)
+        self._connect().execute(
+            "INSERT INTO metadata (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (cache_key, json.dumps(value, ensure_ascii=False), entry[1]),
+        )
+        self.puts += 1
+        if self.puts % PURGE_EVERY == 0:
+            self.purge()
+
+    def _remember(self, cache_key: str, entry: Tuple[Any, float]) -> None:
+        self.memory[cache_key] = entry
+        self.memory.move_to_end(cache_key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        return dict(self.counts, memory_entries=len(self.memory))
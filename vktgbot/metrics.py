@@ -0,0 +1,138 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from aiohttp import web
+from loguru import logger
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Метрика в текстовом формате Prometheus. Значения хранятся по набору значений меток."""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.values: Dict[tuple, float] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        for key, value in self.values.items():
+            yield self.name, list(zip(self.label_names, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # По набору меток: счётчики корзин (последняя — +Inf), сумма и количество наблюдений
+        self.series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Измеряет время выполнения блока, в том числе с await внутри."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> Iterator[Tuple[str, List[Tuple[str, str]], float]]:
+        for key, (counts, total, count) in self.series.items():
+            labels = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket", labels + [("le", le)], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+VK_REQUEST_SECONDS = Histogram("vk_request_seconds", "VK API request latency.", ("method",))
+VK_CACHE_LOOKUPS = Counter("vk_cache_lookups_total", "VK metadata cache lookups.", ("kind", "result"))
+VK_REQUEST_ERRORS = Counter("vk_request_errors_total", "Failed VK API requests.", ("method", "error"))
+POST_PARSE_SECONDS = Histogram("post_parse_seconds", "Time to parse a post with its attachments.", ("source",))
+TG_REQUEST_SECONDS = Histogram("tg_request_seconds", "Telegram Bot API request latency.", ("method",))
+TG_REQUEST_ERRORS = Counter("tg_request_errors_total", "Failed Telegram Bot API requests.", ("method", "error"))
+TG_RETRY_AFTER_SECONDS = Counter("tg_retry_after_seconds_total", "Time spent waiting on RetryAfter.", ("chat",))
+TG_QUEUE_DEPTH = Gauge("tg_queue_depth", "Jobs waiting in the send queue of a chat.", ("chat",))
+DOWNLOADED_BYTES = Counter("downloaded_bytes_total", "Bytes of media downloaded from VK.", ("kind",))
+TEMP_STORAGE_BYTES = Gauge("temp_storage_bytes", "Disk space reserved for temporary files.", ("folder",))
+PIPELINE_READY_POSTS = Gauge("pipeline_ready_posts", "Prepared posts waiting for delivery.", ("source",))
+DELIVERIES = Counter("deliveries_total", "Post parts delivery results.", ("source", "status"))
+LOG_MESSAGES_DROPPED = Counter("log_messages_dropped_total", "Debug log messages dropped by sampling.", ("channel",))
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Отдаёт метрики по адресу http://host:port/metrics."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics are available at http://{host}:{port}/metrics.")
+    return runner
@@ -1,21 +1,45 @@
-import re
+import asyncio
+import os
+from contextlib import ExitStack
 from typing import Union
 
-import requests
+import aiohttp
 from loguru import logger
 
-from api_requests import get_video_url
-from config import REQ_VERSION, VK_TOKEN
-from tools import add_urls_to_text, prepare_text_for_html, prepare_text_for_reposts, reformat_vk_links
-
-
-def parse_post(item: dict, repost_exists: bool, item_type: str, group_name: str) -> dict:
-    text = prepare_text_for_html(item["text"])
+from api_requests import get_video_key, get_video_url
+from authors import AuthorRegistry
+from config import AUTHORS_FILE, PHOTO_MAX_BYTES, PHOTO_MAX_SIDE, TEXT_REPLACEMENTS
+from file_cache import FileIdCache
+from log_context import videos_logger
+from metrics import DOWNLOADED_BYTES
+from photo_size import choose_photo_size, normalize_photo_url
+from temp_storage import Workspace
+from tools import TextTransformer, add_urls_to_text, prepare_text_for_reposts
+
+# Telegram не принимает от ботов файлы больше 50 МБ
+DOC_SIZE_LIMIT = 50000000
+DOC_CHUNK_SIZE = 64 * 1024
+
+# Ники авторов подгружаются из файла при первом упоминании и при его изменении
+author_registry = AuthorRegistry(AUTHORS_FILE)
+prepare_text = TextTransformer(TEXT_REPLACEMENTS, author_registry)
+
+
+async def parse_post(
+    session: aiohttp.ClientSession,
+    item: dict,
+    repost_exists: bool,
+    item_type: str,
+    group_name: str,
+    videos_info: dict,
+    semaphore: asyncio.Semaphore,
+    workspace: Workspace,
+    file_cache: FileIdCache,
+) -> dict:
+    text = prepare_text(item["text"])
     if repost_exists:
         text = prepare_text_for_reposts(text, item, item_type, group_name)
 
-    text = reformat_vk_links(text)
-
     urls: list = []
     videos: list = []
     videos_urls: list = []
@@ -23,38 +47,56 @@ def parse_post(item: dict, repost_exists: bool, item_type: str, group_name: str)
     docs: list = []
 
     if "attachments" in item:
-        parse_attachments(item["attachments"], text, urls, videos, photos, docs, videos_urls)
-
-    text = add_urls_to_text(text, urls, videos_urls)
-
-    # Доп штуки
-    # text = "ID: " + str(item["id"]) + "\n" + text
-    text = text.replace("@jrpg.wiki", "@jrpg_wiki")
-
+        await parse_attachments(
+            session,
+            item["attachments"],
+            text,
+            urls,
+            videos,
+            photos,
+            docs,
+            videos_urls,
+            videos_info,
+            semaphore,
+            workspace,
+            file_cache,
+        )
+
+    text = prepare_text.replace_literals(add_urls_to_text(text, urls, videos_urls))
 
     logger.info(f"{item_type.capitalize()} parsing is complete.")
     return {"text": text, "photos": photos, "docs": docs, "videos": videos}
 
 
-def parse_attachments(attachments, text, urls, videos, photos, docs, videos_urls):
-    for attachment in attachments:
-        if attachment["type"] == "link":
-            url = get_url(attachment, text)
-            if url:
-                urls.append(url)
-        elif attachment["type"] == "video":
-            video = get_video(attachment, videos_urls)
-            logger.info(f"Video was received: {video}.")
-            if video:
-                videos.append(video)
-        elif attachment["type"] == "photo":
-            photo = get_photo(attachment)
-            if photo:
-                photos.append(photo)
-        elif attachment["type"] == "doc":
-            doc = get_doc(attachment["doc"])
-            if doc:
-                docs.append(doc)
+async def parse_attachments(
+    session, attachments, text, urls, videos, photos, docs, videos_urls, videos_info, semaphore, workspace, file_cache
+):
+    """Все вложения разбираются одновременно, результаты собираются в исходном порядке."""
+    # У каждого вложения свой список ссылок на видео, чтобы сохранить порядок
+    attachments_videos_urls: list = [[] for _ in attachments]
+
+    async def resolve(attachment: dict, attachment_videos_urls: list):
+        async with semaphore:
+            if attachment["type"] == "link":
+                return get_url(attachment, text)
+            elif attachment["type"] == "video":
+                video = await get_video(session, attachment, attachment_videos_urls, videos_info, file_cache)
+                videos_logger.debug("Video was received: {}.", video)
+                return video
+            elif attachment["type"] == "photo":
+                return get_photo(attachment)
+            elif attachment["type"] == "doc":
+                return await get_doc(session, attachment["doc"], workspace, file_cache)
+
+    results = await asyncio.gather(
+        *(resolve(attachment, attachments_videos_urls[i]) for i, attachment in enumerate(attachments))
+    )
+
+    targets = {"link": urls, "video": videos, "photo": photos, "doc": docs}
+    for attachment, result, attachment_videos_urls in zip(attachments, results, attachments_videos_urls):
+        videos_urls.extend(attachment_videos_urls)
+        if result:
+            targets[attachment["type"]].append(result)
 
 
 def get_url(attachment: dict, text: str) -> Union[str, None]:
@@ -62,50 +104,104 @@ def get_url(attachment: dict, text: str) -> Union[str, None]:
     return url if url not in text else None
 
 
-def get_video(attachment: dict, videos_urls: list) -> str:
-
+async def get_video(
+    session: aiohttp.ClientSession, attachment: dict, videos_urls: list, videos_info: dict, file_cache: FileIdCache
+) -> Union[dict, None]:
     owner_id = attachment["video"]["owner_id"]
     video_id = attachment["video"]["id"]
     video_type = attachment["video"]["type"]
-    access_key = attachment["video"].get("access_key", "")
 
-    video = get_video_url(VK_TOKEN, REQ_VERSION, owner_id, video_id, access_key, videos_urls)
-    logger.info(f"Video URL was received: {video}.")
+    # Уже загруженное в Telegram видео отправляется по file_id, выбирать файл не нужно
+    if file_cache.get(f"video{owner_id}_{video_id}"):
+        return {"id": f"video{owner_id}_{video_id}", "url": ""}
+
+    video = await get_video_url(session, videos_info.get(get_video_key(attachment["video"])), videos_urls)
+    videos_logger.debug("Video URL was received: {}.", video)
     if video:
-        return video
+        return {"id": f"video{owner_id}_{video_id}", "url": video}
     elif video_type == "short_video":
         videos_urls.append("https://vk.com/clip{owner_id}_{video_id}")
 
 
-def get_photo(attachment: dict) -> Union[str, None]:
-    sizes = attachment["photo"]["sizes"]
-    types = ["w", "z", "y", "x", "r", "q", "p", "o", "m", "s"]
-
-    for type_ in types:
-        if next(
-            (item for item in sizes if item["type"] == type_),
-            False,
-        ):
-            return re.sub(
-                "&([a-zA-Z]+(_[a-zA-Z]+)+)=([a-zA-Z0-9-_]+)",
-                "",
-                next(
-                    (item for item in sizes if item["type"] == type_),
-                    False,
-                )["url"],
-            )
-    else:
+def get_photo(attachment: dict) -> Union[dict, None]:
+    photo_id = f"photo{attachment['photo']['owner_id']}_{attachment['photo']['id']}"
+    size = choose_photo_size(attachment["photo"]["sizes"], PHOTO_MAX_SIDE, PHOTO_MAX_BYTES)
+    if size is None:
         return None
+    return {"id": photo_id, "url": normalize_photo_url(size["url"])}
 
 
-def get_doc(doc: dict) -> Union[dict, None]:
-    if doc["size"] > 50000000:
+async def get_doc(
+    session: aiohttp.ClientSession, doc: dict, workspace: Workspace, file_cache: FileIdCache
+) -> Union[dict, None]:
+    if doc["size"] > DOC_SIZE_LIMIT:
         logger.info(f"The document was skipped due to its size exceeding the 50MB limit: {doc['size']=}.")
         return None
+
+    doc_id = f"doc{doc['owner_id']}_{doc['id']}"
+    # Уже загруженный в Telegram документ повторно не скачивается
+    file_id = file_cache.get(doc_id)
+    if file_id:
+        return {"id": doc_id, "title": doc["title"], "url": doc["url"], "path": None, "data": None, "file_id": file_id}
+
+    # Небольшой документ остаётся в памяти, большой пишется на диск частями в каталог поста
+    data: Union[bytearray, None] = None
+    path: Union[str, None] = None
+    if doc["size"] <= workspace.spool_size:
+        data = bytearray()
+        allowed = workspace.spool_size
+    elif await workspace.reserve(doc["size"]):
+        path = workspace.file_path(doc["title"])
+        allowed = doc["size"]
     else:
-        response = requests.get(doc["url"])
+        logger.error(f"The document was skipped because it does not fit into the temp storage quota: {doc['url']}.")
+        return None
 
-        with open(f'./temp/{doc["title"]}', "wb") as file:
-            file.write(response.content)
+    downloaded = 0
+    try:
+        async with session.get(doc["url"]) as response:
+            response.raise_for_status()
+            with ExitStack() as stack:
+                file = stack.enter_context(open(path, "wb")) if path else None
+                async for chunk in response.content.iter_chunked(DOC_CHUNK_SIZE):
+                    downloaded += len(chunk)
+                    DOWNLOADED_BYTES.inc(len(chunk), kind="doc")
+                    if downloaded > DOC_SIZE_LIMIT:
+                        break
+                    # VK занизил размер: место на диске резервируется до предела Telegram, а документ
+                    # из памяти переносится в файл, чтобы в памяти не оказалось до 50 МБ
+                    if downloaded > allowed:
+                        if not await workspace.reserve(DOC_SIZE_LIMIT - (allowed if path else 0)):
+                            logger.error(f"The document was skipped because it is larger than VK reported "
+                                         f"and does not fit into the temp storage quota: {doc['url']}.")
+                            downloaded = -1
+                            break
+                        allowed = DOC_SIZE_LIMIT
+                        if not path:
+                            path = workspace.file_path(doc["title"])
+                            file = stack.enter_context(open(path, "wb"))
+                            file.write(data)
+                            data = None
+                    if file:
+                        file.write(chunk)
+                    else:
+                        data += chunk
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"The document was not downloaded: {e}")
+        downloaded = -1
+
+    if downloaded < 0 or downloaded > DOC_SIZE_LIMIT:
+        if downloaded > DOC_SIZE_LIMIT:
+            logger.info(f"The document was skipped due to its size exceeding the 50MB limit: {doc['url']}.")
+        if path and os.path.exists(path):
+            os.remove(path)
+        return None
 
-    return {"title": doc["title"], "url": doc["url"]}
+    return {
+        "id": doc_id,
+        "title": doc["title"],
+        "url": doc["url"],
+        "path": path,
+        "data": bytes(data) if data is not None else None,
+        "file_id": None,
+    }
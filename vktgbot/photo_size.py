@@ -0,0 +1,48 @@
+import re
+from typing import Union
+
+# Типы размеров фото VK от лучшего к худшему
+TYPE_PRIORITY = {type_: rank for rank, type_ in enumerate("wzyxrqpoms")}
+
+# Примерный размер JPEG от VK в байтах на пиксель, для оценки фото по бюджету
+BYTES_PER_PIXEL = 0.25
+
+# Параметры вида &c_uniq_tag=... меняются от запроса к запросу и мешают Telegram кэшировать фото
+UNIQ_PARAM_PATTERN = re.compile(r"&([a-zA-Z]+(_[a-zA-Z]+)+)=([a-zA-Z0-9-_]+)")
+
+
+def normalize_photo_url(url: str) -> str:
+    return UNIQ_PARAM_PATTERN.sub("", url)
+
+
+def choose_photo_size(sizes: list, max_side: int = 0, max_bytes: int = 0) -> Union[dict, None]:
+    """
+    Лучший размер фото за один проход по списку sizes. Размеры больше max_side пикселей
+    по длинной стороне или с оценкой больше max_bytes байт пропускаются (0 — без ограничения).
+    Если под ограничения не подходит ни один размер, берётся самый маленький.
+    """
+    best = None
+    best_rank = len(TYPE_PRIORITY)
+    if not max_side and not max_bytes:
+        for size in sizes:
+            rank = TYPE_PRIORITY.get(size["type"], best_rank)
+            if rank < best_rank:
+                best, best_rank = size, rank
+        return best
+
+    smallest = None
+    for size in sizes:
+        rank = TYPE_PRIORITY.get(size["type"])
+        if rank is None:
+            continue
+        width, height = size.get("width", 0), size.get("height", 0)
+        # У старых фото ширина и высота бывают нулевыми, такие размеры не ограничиваются
+        too_big = max_side and max(width, height) > max_side
+        too_heavy = max_bytes and width * height * BYTES_PER_PIXEL > max_bytes
+        if too_big or too_heavy:
+            if smallest is None or width * height < smallest.get("width", 0) * smallest.get("height", 0):
+                smallest = size
+            continue
+        if rank < best_rank:
+            best, best_rank = size, rank
+    return best or smallest
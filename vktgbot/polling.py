@@ -0,0 +1,102 @@
+import math
+import random
+import time
+from typing import List, Union
+
+HOUR = 3600
+# Через сколько дней вклад поста в профиль стены уменьшается вдвое
+HALF_LIFE_DAYS = 14
+# Сколько постов нужно увидеть, прежде чем доверять профилю
+MIN_POSTS = 20
+# Сколько опросов подряд после новых постов идут с минимальным интервалом: посты часто выходят сериями
+BURST_POLLS = 3
+# Пока профилю нельзя доверять, пауза растёт со временем с последнего поста: 1/QUIET_RATIO этого времени
+QUIET_RATIO = 10
+
+
+class AdaptiveInterval:
+    """
+    Интервал опроса стены, подстроенный под то, когда на ней обычно выходят посты.
+
+    По датам увиденных постов строится профиль частоты публикаций по часам суток
+    (старые посты со временем весят меньше). Интервал для часа с частотой `rate`
+    равен начальному, умноженному на sqrt(средняя частота / rate): в часы активности
+    стена опрашивается чаще, в тихие часы — реже, вплоть до максимума. Такое
+    соотношение даёт наименьшую задержку доставки при том же числе запросов.
+    После новых постов несколько опросов идут с минимальным интервалом.
+    Пока постов для профиля мало, стена, на которой давно тихо, опрашивается реже.
+    Профиль сохраняется в журнале (state, restore) и переживает перезапуск.
+    """
+
+    def __init__(self, interval: float, min_interval: float, max_interval: float, jitter: float = 0.1):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.jitter = jitter
+        self.base_interval = self._clamp(interval)
+        self.hour_weights = [0.0] * 24
+        self.posts_seen = 0
+        self.updated_at: Union[float, None] = None
+        self.last_post_date = 0
+        self.burst_left = 0
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def state(self) -> dict:
+        return {
+            "hour_weights": self.hour_weights,
+            "posts_seen": self.posts_seen,
+            "updated_at": self.updated_at,
+            "last_post_date": self.last_post_date,
+        }
+
+    def restore(self, state: dict) -> None:
+        self.hour_weights = list(state["hour_weights"])
+        self.posts_seen = state["posts_seen"]
+        self.updated_at = state["updated_at"]
+        self.last_post_date = state["last_post_date"]
+
+    def observe(self, post_dates: List[int]) -> int:
+        """
+        Учитывает даты постов (unixtime). Посты не новее последнего учтённого пропускаются,
+        поэтому можно передавать все посты полученной страницы стены. Возвращает число учтённых.
+        """
+        observed = 0
+        for date in sorted(post_dates):
+            if date <= self.last_post_date:
+                continue
+            if self.updated_at is not None:
+                decay = 0.5 ** ((date - self.updated_at) / (HALF_LIFE_DAYS * 24 * HOUR))
+                self.hour_weights = [weight * decay for weight in self.hour_weights]
+            self.updated_at = date
+            self.hour_weights[int(date // HOUR % 24)] += 1
+            self.posts_seen += 1
+            self.last_post_date = date
+            observed += 1
+        return observed
+
+    def target_interval(self, now: float) -> float:
+        """Интервал по профилю стены для текущего часа, без серий и разброса."""
+        if self.posts_seen < MIN_POSTS:
+            if not self.last_post_date:
+                return self.base_interval
+            return self._clamp(max(self.base_interval, (now - self.last_post_date) / QUIET_RATIO))
+        hour = int(now // HOUR % 24)
+        # Соседние часы сглаживают границы: пост в 8:55 говорит и о 9 часах
+        rate = (self.hour_weights[hour - 1] + 2 * self.hour_weights[hour] + self.hour_weights[(hour + 1) % 24]) / 4
+        mean_rate = sum(self.hour_weights) / 24
+        if rate <= 0:
+            return self.max_interval
+        return self._clamp(self.base_interval * math.sqrt(mean_rate / rate))
+
+    def next_interval(self, found_new: bool, now: Union[float, None] = None) -> float:
+        """Пауза до следующего опроса в секундах, со случайным разбросом ±jitter."""
+        now = time.time() if now is None else now
+        if found_new:
+            self.burst_left = BURST_POLLS
+        if self.burst_left:
+            self.burst_left -= 1
+            interval = self.min_interval
+        else:
+            interval = self.target_interval(now)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
@@ -0,0 +1,79 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import List, Union
+
+from loguru import logger
+
+import config
+from keyword_filter import KeywordMatcher
+from temp_storage import TempStorage
+
+
+@dataclass
+class Source:
+    """Стена VK и каналы Telegram, в которые пересылаются её посты, со своими фильтрами."""
+
+    name: str
+    vk_domain: str
+    tg_channels: List[str]
+    interval: int = config.TIME_TO_SLEEP
+    req_filter: str = config.REQ_FILTER
+    skip_ads_posts: bool = config.SKIP_ADS_POSTS
+    skip_copyrighted_post: bool = config.SKIP_COPYRIGHTED_POST
+    skip_reposts: bool = config.SKIP_REPOSTS
+    whitelist: list = field(default_factory=lambda: list(config.WHITELIST))
+    blacklist: list = field(default_factory=lambda: list(config.BLACKLIST))
+    keywords_mode: str = config.KEYWORDS_MODE
+    # ID сообщества для Callback API; если не задан, определяется по vk_domain
+    group_id: Union[int, None] = None
+    callback_confirmation: str = config.CALLBACK_CONFIRMATION
+    # ID последнего поста для первого запуска, если его ещё нет в журнале
+    last_id: Union[int, None] = None
+    # Источник из переменных окружения: на первом запуске ID берётся из last_id.txt
+    from_env: bool = False
+    # Автоматы поиска слов строятся один раз при загрузке маршрута
+    whitelist_matcher: KeywordMatcher = field(init=False, repr=False)
+    blacklist_matcher: KeywordMatcher = field(init=False, repr=False)
+    temp_storage: TempStorage = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.whitelist_matcher = KeywordMatcher(self.whitelist, self.keywords_mode)
+        self.blacklist_matcher = KeywordMatcher(self.blacklist, self.keywords_mode)
+        self.temp_storage = TempStorage(
+            self.temp_folder, config.TEMP_QUOTA_MB * 1024 * 1024, config.TEMP_SPOOL_KB * 1024
+        )
+
+    @property
+    def temp_folder(self) -> str:
+        return os.path.join("temp", self.name)
+
+
+def load_sources(routes_file: str = config.ROUTES_FILE) -> List[Source]:
+    """
+    Источники из файла маршрутов. Если файла нет — единственный источник
+    из переменных окружения VAR_VK_DOMAIN и VAR_TG_CHANNEL.
+    """
+    if not routes_file or not os.path.exists(routes_file):
+        return [
+            Source(name=config.VK_DOMAIN, vk_domain=config.VK_DOMAIN, tg_channels=[config.TG_CHANNEL], from_env=True)
+        ]
+
+    with open(routes_file, "r", encoding="utf-8") as file:
+        routes = json.load(file)
+
+    sources = []
+    for route in routes["sources"]:
+        if not route.get("vk_domain") or not route.get("tg_channels"):
+            raise ValueError(f"Each route in {routes_file} needs 'vk_domain' and 'tg_channels': {route}")
+        if isinstance(route["tg_channels"], str):
+            route["tg_channels"] = [route["tg_channels"]]
+        route.setdefault("name", route["vk_domain"])
+        sources.append(Source(**route))
+
+    names = [source.name for source in sources]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Route names in {routes_file} must be unique: {names}")
+
+    logger.info(f"Loaded {len(sources)} sources from {routes_file}: {', '.join(names)}.")
+    return sources
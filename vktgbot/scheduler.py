@@ -0,0 +1,230 @@
+import asyncio
+from typing import Dict, List, Set, Union
+
+from loguru import logger
+
+import config
+from api_requests import get_group_ids, get_post_by_id, matches_req_filter
+from callback_server import CallbackServer
+from journal import Journal
+from leases import LeaseStore
+from polling import AdaptiveInterval
+from routes import Source
+from start_script import process_post, start_script
+from tg_sender import TelegramSender
+from vk_client import VkClient
+
+
+@logger.catch
+async def run_cycle(
+    sender: TelegramSender,
+    vk: VkClient,
+    journal: Journal,
+    source: Source,
+    lock: asyncio.Lock,
+    page_dates: Union[list, None] = None,
+) -> List[dict]:
+    # Опрос стены и посты из Callback API одного источника обрабатываются по очереди
+    async with lock:
+        return await start_script(sender, vk, journal, source, page_dates)
+
+
+async def run_source(
+    sender: TelegramSender,
+    vk: VkClient,
+    journal: Journal,
+    source: Source,
+    lock: asyncio.Lock,
+    interval: float,
+    adaptive: bool = False,
+) -> None:
+    polling = None
+    if adaptive:
+        polling = AdaptiveInterval(interval, config.POLL_MIN_INTERVAL, config.POLL_MAX_INTERVAL, config.POLL_JITTER)
+        # Профиль стены общий для перезапусков и процессов, которые по очереди берут источник
+        profile = journal.get_poll_profile(source.name)
+        if profile:
+            polling.restore(profile)
+    while True:
+        page_dates: List[int] = []
+        # При исключении logger.catch возвращает None
+        items = await run_cycle(sender, vk, journal, source, lock, page_dates) or []
+        # Новый профиль сразу заполняется датами уже полученной страницы стены
+        if polling and polling.observe(page_dates):
+            journal.set_poll_profile(source.name, polling.state())
+        if config.SINGLE_START:
+            return
+        if polling:
+            interval = polling.next_interval(bool(items))
+        logger.info(f"[{source.name}] Source went to sleep for {interval:.0f} seconds.")
+        await asyncio.sleep(interval)
+
+
+@logger.catch
+async def handle_callback_post(
+    sender: TelegramSender,
+    vk: VkClient,
+    journal: Journal,
+    source: Source,
+    lock: asyncio.Lock,
+    group_id: int,
+    post_id: int,
+) -> None:
+    """
+    Событие Callback API — только сигнал: пост запрашивается у VK по ID, проверяется фильтром
+    источника, как при опросе стены, и сразу уходит в разбор и отправку. ID последнего поста
+    при этом не меняется: его двигает только опрос стены, который заодно подбирает пропущенные
+    события, а уже отправленные части поста журнал повторно не пропустит.
+    """
+    async with lock:
+        last_known_id = journal.get_last_id(source.name)
+        if last_known_id is None or post_id <= last_known_id:
+            return
+        logger.info(f"[{source.name}] Got post with ID {post_id} from the Callback API.")
+        item = await get_post_by_id(vk, -group_id, post_id)
+        if item is None:
+            logger.warning(f"[{source.name}] Post with ID {post_id} was not found in VK. It is left to polling.")
+            return
+        if not matches_req_filter(item, source.req_filter):
+            logger.info(f"[{source.name}] Post with ID {post_id} does not match the {source.req_filter} filter.")
+            return
+        await process_post(sender, vk, journal, source, item)
+
+
+async def start_callback_server(
+    sender: TelegramSender, vk: VkClient, journal: Journal, sources: List[Source], locks: Dict[str, asyncio.Lock]
+) -> Union[CallbackServer, None]:
+    """
+    Запускает сервер Callback API для источников-сообществ. None, если ни одно сообщество
+    не найдено или не задан секретный ключ.
+    """
+    if not config.CALLBACK_SECRET:
+        logger.error("Callback API server was not started: VAR_CALLBACK_SECRET is not set. Sources are polled.")
+        return None
+    unresolved = [source.vk_domain for source in sources if source.group_id is None]
+    group_ids = await get_group_ids(vk, unresolved) if unresolved else {}
+
+    sources_by_group: Dict[int, List[Source]] = {}
+    for source in sources:
+        group_id = source.group_id or group_ids.get(source.vk_domain)
+        if group_id is None:
+            logger.warning(f"[{source.name}] {source.vk_domain} is not a community. It will be polled only.")
+            continue
+        sources_by_group.setdefault(group_id, []).append(source)
+    if not sources_by_group:
+        return None
+
+    async def handle(source: Source, group_id: int, post_id: int) -> None:
+        await handle_callback_post(sender, vk, journal, source, locks[source.name], group_id, post_id)
+
+    server = CallbackServer(sources_by_group, handle, config.CALLBACK_SECRET, config.CALLBACK_PATH)
+    await server.start(config.CALLBACK_HOST, config.CALLBACK_PORT)
+    return server
+
+
+async def run_scheduler(sender: TelegramSender, vk: VkClient, journal: Journal, sources: List[Source]) -> None:
+    """
+    Опрашивает все источники в одном процессе, каждый со своим интервалом.
+    Все источники делят один VkClient, а значит и общий лимит запросов к VK.
+    С Callback API новые посты приходят событиями, а опрос становится редким и только подбирает пропуски.
+    """
+    locks = {source.name: asyncio.Lock() for source in sources}
+    server = None
+    if config.CALLBACK_ENABLED and not config.SINGLE_START:
+        server = await start_callback_server(sender, vk, journal, sources, locks)
+    callback_sources = {source.name for group in server.sources.values() for source in group} if server else set()
+
+    try:
+        await asyncio.gather(
+            *(
+                run_source(
+                    sender,
+                    vk,
+                    journal,
+                    source,
+                    locks[source.name],
+                    (
+                        max(source.interval, config.CALLBACK_POLL_INTERVAL)
+                        if source.name in callback_sources
+                        else source.interval
+                    ),
+                    adaptive=config.ADAPTIVE_POLLING and source.name not in callback_sources,
+                )
+                for source in sources
+            )
+        )
+    finally:
+        if server:
+            await server.close()
+
+
+async def stop_between_cycles(task: asyncio.Task, lock: asyncio.Lock) -> None:
+    """Останавливает опрос источника, не прерывая начатый цикл: отправка поста доходит до конца."""
+    async with lock:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def run_worker(
+    sender: TelegramSender, vk: VkClient, journal: Journal, sources: List[Source], leases: LeaseStore
+) -> None:
+    """
+    Режим нескольких процессов: процесс опрашивает только арендованные источники, не больше
+    своей доли. Аренды продлеваются каждую треть срока. Источник, аренду которого забрал
+    другой процесс, останавливается после текущего цикла. Лишний при появлении новых процессов —
+    отпускается между циклами, чтобы пост не ушёл дважды.
+    """
+    locks = {source.name: asyncio.Lock() for source in sources}
+    tasks: Dict[str, asyncio.Task] = {}
+    stopping: Set[asyncio.Task] = set()
+    # С SINGLE_START источник опрашивается один раз и больше не берётся
+    finished = set()
+    try:
+        while True:
+            leases.heartbeat()
+            held = leases.renew(tasks)
+            for name in list(tasks):
+                if name not in held:
+                    logger.warning(f"[{name}] Source lease was taken over by another worker.")
+                    # Отмена посреди отправки оборвала бы пост на полпути, поэтому ждём конца цикла
+                    stopping.add(asyncio.create_task(stop_between_cycles(tasks.pop(name), locks[name])))
+                elif tasks[name].done():
+                    tasks.pop(name)
+                    finished.add(name)
+                    leases.release(name)
+
+            share = leases.fair_share(len(sources))
+            for source in sources:
+                if len(tasks) > share and source.name in tasks and not locks[source.name].locked():
+                    tasks.pop(source.name).cancel()
+                    leases.release(source.name)
+                elif (
+                    len(tasks) < share
+                    and source.name not in tasks
+                    and source.name not in finished
+                    and leases.try_acquire(source.name)
+                ):
+                    tasks[source.name] = asyncio.create_task(
+                        run_source(
+                            sender,
+                            vk,
+                            journal,
+                            source,
+                            locks[source.name],
+                            source.interval,
+                            adaptive=config.ADAPTIVE_POLLING,
+                        )
+                    )
+
+            if config.SINGLE_START:
+                if not tasks:
+                    return
+                # Завершённый источник отпускается сразу, не дожидаясь продления аренд
+                await asyncio.wait(list(tasks.values()), timeout=leases.ttl / 3, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(leases.ttl / 3)
+            stopping = {task for task in stopping if not task.done()}
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), *stopping, return_exceptions=True)
@@ -1,137 +1,239 @@
 import asyncio
+import io
 import re
+from contextlib import ExitStack
+from typing import List, Union
 
-from aiogram import Bot, types
 import aiohttp
+from aiogram import types
 from aiogram.utils import exceptions
 from loguru import logger
 
-from tools import split_text
-
-
-async def get_file_size(url: str) -> int:
-    async with aiohttp.ClientSession() as session:
-        async with session.head(url) as response:
-            return int(response.headers.get("Content-Length", 0))
-
-
-async def send_post(bot: Bot, tg_channel: str, text: str,
-                    photos: list, videos: list, docs: list, num_tries: int = 0) -> None:
-    """Главная функция по отправке поста в телеграм"""
-    num_tries += 1
-    logger.info("Videos: " + str(videos))
-    if num_tries > 3:
-        logger.error("Post was not sent to Telegram. Too many tries.")
-        return
-    try:
+from log_context import videos_logger
+from metrics import DOWNLOADED_BYTES
+from text_chunker import CAPTION_LIMIT, MESSAGE_LIMIT, html_length, split_html
+from tg_sender import TelegramSender
+
+# Пометки на стыке частей длинного текста
+CONTINUED_FROM = "(...) "
+CONTINUED_ON = " (...)"
+# Telegram принимает в одном альбоме не больше 10 медиа
+ALBUM_SIZE = 10
+# Сообщение вместо репоста, который уже есть в канале
+DUPLICATE_TEXT = '<a href="{link}"><b>Этот репост уже был в канале ↑</b></a>'
+# Ошибки Telegram, с которыми он отвергает file_id: устаревший, чужого бота или другого типа медиа
+FILE_ID_ERRORS = (
+    exceptions.WrongFileIdentifier,
+    exceptions.WrongRemoteFileIdSpecified,
+    exceptions.TypeOfFileMismatch,
+)
+
+
+class StaleFileIdError(Exception):
+    """Telegram не принял file_id из кэша. Повторять запрос с теми же file_id бессмысленно."""
+
+    def __init__(self, error: exceptions.TelegramAPIError):
+        super().__init__(str(error))
+        self.error = error
+
+
+async def send_post(sender: TelegramSender, tg_channel: str, text: str,
+                    photos: list, videos: list, docs: list) -> Union[int, None]:
+    """
+    Главная функция по отправке поста в телеграм. Возвращает ID первого сообщения поста
+    (0, если отправлять было нечего) или None, если пост так и не отправлен.
+    """
+    videos_logger.debug("Videos: {}", videos)
+
+    async def send_parts() -> int:
         # Особый режим для постов-впечатлений об играх
         if text.startswith("Впечатления"):
-            await send_impressions_post(bot, tg_channel, text, photos)
+            message_id = await send_impressions_post(sender, tg_channel, text, photos)
 
         # Если нет фото, видео и документов — просто текст
         elif len(photos) == 0 and len(videos) == 0:
-            await send_text_post(bot, tg_channel, text)
+            message_id = await send_text_post(sender, tg_channel, text)
         else:
-            await send_media_post(bot, tg_channel, text, photos, videos)
+            message_id = await send_media_post(sender, tg_channel, text, photos, videos)
         if docs:
-            await send_docs_post(bot, tg_channel, docs)
+            docs_message_id = await send_docs_post(sender, tg_channel, docs)
+            message_id = message_id or docs_message_id
+        return message_id or 0
 
-        return
+    # Части поста уходят одной задачей в очередь канала, поэтому не перемешиваются с другими постами
+    try:
+        return await sender.submit(tg_channel, send_parts)
+    except exceptions.TelegramAPIError as ex:
+        logger.error(f"Post was not sent to Telegram. {ex!r}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+        logger.error(f"Post was not sent to Telegram. Network error: {ex!r}")
+    return None
 
-    except exceptions.RetryAfter as ex:
-        logger.warning(f"Flood limit is exceeded. Sleep {ex.timeout} seconds. Try: {num_tries}")
-        await asyncio.sleep(ex.timeout)
-        await send_post(bot, tg_channel, text, photos, videos, docs, num_tries)
-    except exceptions.BadRequest as ex:
-        logger.warning(f"Bad request. Wait 60 seconds. Try: {num_tries}. {ex}")
-        await asyncio.sleep(60)
-        await send_post(bot, tg_channel, text, photos, videos, docs, num_tries)
 
+def message_link(tg_channel: str, message_id: int) -> Union[str, None]:
+    """Ссылка на сообщение в канале: по имени канала или, для закрытого канала, по его ID."""
+    if tg_channel.startswith("@"):
+        return f"https://t.me/{tg_channel[1:]}/{message_id}"
+    if tg_channel.startswith("-100"):
+        return f"https://t.me/c/{tg_channel[4:]}/{message_id}"
+    return None
 
-async def send_text_post(bot: Bot, tg_channel: str, text: str) -> None:
-    if not text:
-        return
 
-    if len(text) < 4096:
-        await bot.send_message(tg_channel, text, parse_mode=types.ParseMode.HTML)
-        logger.info(f"Text post with length {len(text)} sent to Telegram.")
-    else:
-        text_parts = split_text_by_chunks(text)
-        prepared_text_parts = (
-            [text_parts[0] + " (...)"]
-            + ["(...) " + part + " (...)" for part in text_parts[1:-1]]
-            + ["(...) " + text_parts[-1]]
+async def send_text_post(sender: TelegramSender, tg_channel: str, text: str) -> Union[int, None]:
+    if not text:
+        return None
+
+    text_parts = split_html(text, MESSAGE_LIMIT)
+    if len(text_parts) > 1:
+        # Длинный текст делится с запасом под пометки продолжения
+        text_parts = split_html(text, MESSAGE_LIMIT - len(CONTINUED_FROM) - len(CONTINUED_ON))
+        text_parts = (
+            [text_parts[0] + CONTINUED_ON]
+            + [CONTINUED_FROM + part + CONTINUED_ON for part in text_parts[1:-1]]
+            + [CONTINUED_FROM + text_parts[-1]]
         )
 
-        for part in prepared_text_parts:
-            await bot.send_message(tg_channel, part, parse_mode=types.ParseMode.HTML)
-            await asyncio.sleep(0.5)
-        logger.info(f"Text post with length {len(text)} spilt into {len(prepared_text_parts)} chunks sent to Telegram.")
-
-
-def split_text_by_chunks(text: str) -> list:
-    """Разделение текста на чанки по словам и абзацам, чтобы не превышать лимит в 4096 символов."""
-    return_text = []
-    cursor_index = 0
-    while cursor_index + 4096 < len(text):
-        chunk = text[cursor_index:cursor_index + 4096]
-        # Сначала пробуем делить по абзацу
-        paragraph_index = chunk.rfind("\n\n")
-        if paragraph_index != -1:
-            return_text.append(chunk[: paragraph_index + 2])
-            cursor_index += paragraph_index + 2
-            continue
-
-        # Если не получилось, то пробуем делить по слову
-        space_index = chunk.rfind(" ")
-        if space_index != -1:
-            return_text.append(chunk[: space_index + 1])
-            cursor_index += space_index + 1
-        else:
-            return_text.append(chunk)
-            cursor_index += 4096
-    return_text.append(text[cursor_index:])
-    return return_text
+    message_ids = []
+    for part in text_parts:
+        message = await sender.request(
+            tg_channel, sender.bot.send_message, tg_channel, part, parse_mode=types.ParseMode.HTML
+        )
+        message_ids.append(message.message_id)
+    logger.info(f"Text post with length {len(text)} split into {len(text_parts)} chunks sent to Telegram.")
+    return message_ids[0]
 
 
-async def send_impressions_post(bot: Bot, tg_channel: str, text: str, photos: list) -> None:
+async def send_impressions_post(sender: TelegramSender, tg_channel: str, text: str, photos: list) -> int:
     # Текст делится на три части: начало, понравилось, не понравилось.
     logger.info("Recognized impressions post.")
     text = re.split("ЧТО ПОНРАВИЛОСЬ|ЧТО НЕ ПОНРАВИЛОСЬ", text)
-    await send_media_post(bot, tg_channel, text[0], photos, [])
-    await send_text_post(bot, tg_channel, "ЧТО ПОНРАВИЛОСЬ" + text[1])
-    await send_text_post(bot, tg_channel, "ЧТО НЕ ПОНРАВИЛОСЬ" + text[2])
-
-
-async def send_media_post(bot: Bot, tg_channel: str, text: str, photos: list, videos: list) -> None:
-    """Функция отправки сообщения с медиа"""
-
-    # Добавляем фото и видео в группу медиа
-    media = types.MediaGroup()
-    for photo in photos:
-        media.attach_photo(types.InputMediaPhoto(photo))
-    for video in videos:
-        media.attach_video(types.InputMediaVideo(video))
-
-    # Определяем размер текста, и на этой основе выбираем способ отправки
-    if text and (len(text) <= 1024):
-        media.media[0].caption = text
-        media.media[0].parse_mode = types.ParseMode.HTML
-    elif len(text) <= 4096:
-        await send_text_post(bot, tg_channel, text)
+    message_id = await send_media_post(sender, tg_channel, text[0], photos, [])
+    await send_text_post(sender, tg_channel, "ЧТО ПОНРАВИЛОСЬ" + text[1])
+    await send_text_post(sender, tg_channel, "ЧТО НЕ ПОНРАВИЛОСЬ" + text[2])
+    return message_id
+
+
+def split_into_albums(items: list, album_size: int = ALBUM_SIZE) -> List[list]:
+    """Делит медиа на альбомы примерно равного размера, чтобы в конце не оставался одиночный файл."""
+    if not items:
+        return []
+    count = -(-len(items) // album_size)
+    size, extra = divmod(len(items), count)
+    albums = []
+    start = 0
+    for index in range(count):
+        end = start + size + (index < extra)
+        albums.append(items[start:end])
+        start = end
+    return albums
+
+
+async def send_media_post(
+    sender: TelegramSender, tg_channel: str, text: str, photos: list, videos: list
+) -> Union[int, None]:
+    """Функция отправки сообщения с медиа. Возвращает ID первого сообщения."""
+    media = [(types.InputMediaPhoto, photo) for photo in photos] + [(types.InputMediaVideo, video) for video in videos]
+    # Например, пост-впечатление без фото: подписывать нечего, текст уходит обычным сообщением
+    if not media:
+        return await send_text_post(sender, tg_channel, text)
+
+    # Короткий текст становится подписью к первому альбому, длинный уходит отдельными сообщениями перед медиа
+    message_id = None
+    caption = None
+    if text and html_length(text) <= CAPTION_LIMIT:
+        caption = text
     else:
-        for i in range(len(text) // 4096):
-            await send_text_post(bot, tg_channel, text[i * 4096:(i + 1) * 4096])
-
-    # Отправляем всё медиа
-    await bot.send_media_group(tg_channel, media)
-
-    logger.info("Text post with media sent to Telegram.")
+        message_id = await send_text_post(sender, tg_channel, text)
+
+    # Альбомы одного поста идут строго по порядку, поэтому отправляются друг за другом
+    albums = split_into_albums(media)
+    for index, album in enumerate(albums):
+        messages = await send_media_album(sender, tg_channel, album, caption if index == 0 else None)
+        sender.file_cache.remember([item["id"] for _, item in album], messages)
+        message_id = message_id or messages[0].message_id
+
+    logger.info(f"Text post with {len(media)} media in {len(albums)} albums sent to Telegram.")
+    return message_id
+
+
+async def send_media_album(sender: TelegramSender, tg_channel: str, album: list, caption: Union[str, None]) -> list:
+    """
+    Альбом фото и видео. Уже загруженные в Telegram медиа отправляются по file_id. Если Telegram
+    их не принял, file_id удаляются из кэша, и альбом уходит заново по ссылкам.
+    """
+
+    async def send_media_group(file_ids: dict):
+        group = types.MediaGroup()
+        for media_type, item in album:
+            media = media_type(file_ids.get(item["id"]) or item["url"])
+            if caption and not group.media:
+                media.caption = caption
+                media.parse_mode = types.ParseMode.HTML
+            group.attach(media)
+        try:
+            return await sender.bot.send_media_group(tg_channel, group)
+        except FILE_ID_ERRORS as ex:
+            if file_ids:
+                raise StaleFileIdError(ex) from ex
+            raise
+
+    file_ids = {item["id"]: file_id for _, item in album if (file_id := sender.file_cache.get(item["id"]))}
+    try:
+        return await sender.request(tg_channel, send_media_group, file_ids)
+    except StaleFileIdError as ex:
+        logger.warning(f"Telegram rejected cached file_ids of {', '.join(file_ids)}: {ex}. They are forgotten.")
+        sender.file_cache.forget(list(file_ids))
+        # Видео из кэша разбирается без ссылки: пост уйдёт в следующем цикле, уже со ссылкой
+        if any(not item["url"] for _, item in album):
+            raise ex.error
+    return await sender.request(tg_channel, send_media_group, {})
+
+
+async def send_docs_post(sender: TelegramSender, tg_channel: str, docs: list) -> int:
+    async def send_docs_group(album: list):
+        # Файлы открываются заново при каждой попытке и закрываются сразу после отправки
+        with ExitStack() as stack:
+            media = types.MediaGroup()
+            for doc in album:
+                if doc["file_id"]:
+                    file = doc["file_id"]
+                elif doc["data"] is not None:
+                    file = types.InputFile(io.BytesIO(doc["data"]), filename=doc["title"])
+                else:
+                    file = types.InputFile(stack.enter_context(open(doc["path"], "rb")), filename=doc["title"])
+                media.attach_document(types.InputMediaDocument(file))
+            try:
+                return await sender.bot.send_media_group(tg_channel, media)
+            except FILE_ID_ERRORS as ex:
+                if any(doc["file_id"] for doc in album):
+                    raise StaleFileIdError(ex) from ex
+                raise
+
+    message_id = None
+    for album in split_into_albums(docs):
+        try:
+            messages = await sender.request(tg_channel, send_docs_group, album)
+        except StaleFileIdError as ex:
+            cached = [doc for doc in album if doc["file_id"]]
+            keys = [doc["id"] for doc in cached]
+            logger.warning(f"Telegram rejected cached file_ids of {', '.join(keys)}: {ex}. They are forgotten.")
+            sender.file_cache.forget(keys)
+            # Документы из кэша не скачивались при разборе: они скачиваются сейчас и загружаются заново
+            for doc in cached:
+                doc["data"] = await download_doc(sender, doc["url"])
+                doc["file_id"] = None
+            messages = await sender.request(tg_channel, send_docs_group, album)
+        sender.file_cache.remember([doc["id"] for doc in album], messages)
+        message_id = message_id or messages[0].message_id
+    logger.info("Documents sent to Telegram.")
+    return message_id
 
 
-async def send_docs_post(bot: Bot, tg_channel: str, docs: list) -> None:
-    media = types.MediaGroup()
-    for doc in docs:
-        media.attach_document(types.InputMediaDocument(open(f"./temp/{doc['title']}", "rb")))
-    await bot.send_media_group(tg_channel, media)
-    logger.info("Documents sent to Telegram.")
+async def download_doc(sender: TelegramSender, url: str) -> bytes:
+    """Документ целиком в память. Нужен, только когда file_id документа из кэша устарел."""
+    session = await sender.bot.get_session()
+    async with session.get(url) as response:
+        response.raise_for_status()
+        data = await response.read()
+    DOWNLOADED_BYTES.inc(len(data), kind="doc")
+    return data
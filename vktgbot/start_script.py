@@ -1,112 +1,329 @@
-from typing import Union
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Union
 
-from aiogram import Bot, Dispatcher
-from aiogram.utils import executor
 from loguru import logger
 
 import config
-from api_requests import get_data_from_vk, get_group_name
-from last_id import read_id, write_id, write_time
-from parse_posts import parse_post
-from send_posts import send_post
-from tools import blacklist_check, prepare_temp_folder, whitelist_check
-
-
-def start_script():
-    bot = Bot(token=config.TG_BOT_TOKEN)
-    dp = Dispatcher(bot)
-
-    last_known_id = read_id()
-    offset = 0
-    logger.info(f"Last known ID: {last_known_id}")
-
-    items: Union[dict, None] = get_data_from_vk(
-        config.VK_TOKEN,
-        config.REQ_VERSION,
-        config.VK_DOMAIN,
-        config.REQ_FILTER,
-        config.REQ_COUNT,
-        offset
+from api_requests import get_data_from_vk, get_new_posts, get_post_metadata, metadata_cache
+from journal import ABANDONED, FAILED, SENT, Journal
+from last_id import read_id, write_time
+from log_context import correlation, post_correlation_id
+from metrics import DELIVERIES, PIPELINE_READY_POSTS, POST_PARSE_SECONDS
+from parse_posts import author_registry, parse_post
+from routes import Source
+from send_posts import DUPLICATE_TEXT, message_link, send_post
+from tg_sender import TelegramSender
+from temp_storage import Workspace
+from tools import blacklist_check, content_keys, lookup_content_keys, whitelist_check
+from vk_client import VkClient
+
+
+@dataclass
+class PreparedPost:
+    """Разобранный пост: части, которые ещё не доставлены, каналы для них и каталог временных файлов."""
+
+    item: dict
+    # None — часть не удалось разобрать
+    parts: Dict[str, Union[dict, None]]
+    pending: Dict[str, List[str]]
+    workspace: Workspace
+    # Ключи содержимого частей и ID сообщений, с которыми части уже опубликованы в каналах
+    keys: Dict[str, List[str]] = field(default_factory=dict)
+    duplicates: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+
+async def start_script(
+    sender: TelegramSender, vk: VkClient, journal: Journal, source: Source, page_dates: Union[list, None] = None
+) -> List[dict]:
+    """
+    Один цикл опроса стены. Возвращает новые посты, найденные на стене.
+    В page_dates добавляются даты всех постов со страниц стены, для профиля частоты постов.
+    """
+    last_known_id = journal.get_last_id(source.name)
+    if last_known_id is None:
+        last_known_id = await get_initial_id(vk, source)
+        if last_known_id is None:
+            return []
+        journal.set_last_id(source.name, last_known_id)
+    logger.info(f"[{source.name}] Last known ID: {last_known_id}")
+
+    items: Union[list, None] = await get_new_posts(
+        vk, source.vk_domain, source.req_filter, config.REQ_COUNT, last_known_id, page_dates
     )
-    if not items:
-        return
-
-    if "is_pinned" in items[0]:
-        items = items[1:]
-    logger.info(f"Got a few posts with IDs: {items[-1]['id']} - {items[0]['id']}.")
-    while items and int(items[-1]["id"]) >= last_known_id:
-        offset += config.REQ_COUNT
-        items: Union[dict, None] = get_data_from_vk(
-            config.VK_TOKEN,
-            config.REQ_VERSION,
-            config.VK_DOMAIN,
-            config.REQ_FILTER,
-            config.REQ_COUNT,
-            offset
-        )
-        if not items:
-            logger.error("Error was detected when requesting data from VK.")
-            return
+    if items is None:
+        logger.error(f"[{source.name}] Error was detected when requesting data from VK.")
+        return []
 
-        logger.info(f"Got a few posts with IDs: {items[-1]['id']} - {items[0]['id']}.")
+    if items:
+        logger.info(f"[{source.name}] Got {len(items)} new posts with IDs: {items[0]['id']} - {items[-1]['id']}.")
+    await run_pipeline(sender, vk, journal, source, items)
 
-        if "is_pinned" in items[0]:
-            items = items[1:]
+    journal.write_check_time(source.name)
+    logger.debug("[{}] VK metadata cache: {}", source.name, metadata_cache.stats())
+    logger.debug("[{}] Author lookups: {}", source.name, author_registry.stats())
+    if source.from_env:
+        write_time()
+    return items
 
-    new_last_id: int = items[0]["id"]
 
-    if new_last_id > last_known_id:
-        for item in items[::-1]:
-            item: dict
-            if item["id"] <= last_known_id:
-                continue
-            logger.info(f"Working with post with ID: {item['id']}.")
-            if blacklist_check(config.BLACKLIST, item["text"]):
-                continue
-            if whitelist_check(config.WHITELIST, item["text"]):
-                continue
-            if config.SKIP_ADS_POSTS and item["marked_as_ads"]:
-                logger.info("Post was skipped as an advertisement.")
-                continue
-            if config.SKIP_COPYRIGHTED_POST and "copyright" in item:
-                logger.info("Post was skipped as an copyrighted post.")
-                continue
+async def get_initial_id(vk: VkClient, source: Source) -> Union[int, None]:
+    """ID, с которого начинается новый источник, пока его нет в журнале."""
+    if source.last_id is not None:
+        return source.last_id
+    if source.from_env:
+        # Первый запуск с журналом: берём ID из last_id.txt
+        return read_id()
+
+    # Новый маршрут без last_id: старые посты не пересылаются, начинаем с самого свежего
+    items = await get_data_from_vk(vk, source.vk_domain, source.req_filter, 2)
+    if items is None:
+        return None
+    last_id = max((item["id"] for item in items), default=0)
+    logger.info(f"[{source.name}] New source starts after the latest post with ID: {last_id}.")
+    return last_id
+
 
-            item_parts = {"post": item}
-            group_name = ""
-            if "copy_history" in item and not config.SKIP_REPOSTS:
-                item_parts["repost"] = item["copy_history"][0]
-                group_name = get_group_name(
-                    config.VK_TOKEN,
-                    config.REQ_VERSION,
-                    abs(item_parts["repost"]["owner_id"]),
+async def run_pipeline(
+    sender: TelegramSender, vk: VkClient, journal: Journal, source: Source, items: List[dict]
+) -> None:
+    """
+    Посты разбираются заранее, пока предыдущие отправляются в Telegram. Вперёд разбирается
+    не больше PIPELINE_DEPTH постов: если отправка отстаёт, разбор ждёт. Посты отправляются
+    строго по порядку, после первого недоставленного поста конвейер останавливается.
+    """
+    ready: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(config.PIPELINE_DEPTH)
+
+    async def prepare_all() -> None:
+        try:
+            for item in items:
+                await slots.acquire()
+                with correlation(post_correlation_id(source.name, item["id"])):
+                    prepared = await prepare_post(sender, vk, journal, source, item)
+                ready.put_nowait((item, prepared))
+                PIPELINE_READY_POSTS.set(ready.qsize(), source=source.name)
+        finally:
+            # Конец очереди: все посты разобраны или разбор упал
+            ready.put_nowait(None)
+
+    preparing = asyncio.create_task(prepare_all())
+    try:
+        while True:
+            entry = await ready.get()
+            PIPELINE_READY_POSTS.set(ready.qsize(), source=source.name)
+            if entry is None:
+                break
+            item, prepared = entry
+            try:
+                with correlation(post_correlation_id(source.name, item["id"])):
+                    is_delivered = prepared is None or await deliver_post(sender, journal, source, prepared)
+            finally:
+                if prepared:
+                    prepared.workspace.cleanup()
+                slots.release()
+            if not is_delivered:
+                # Пост будет отправлен заново в следующем цикле, порядок постов сохраняется
+                logger.warning(
+                    f"[{source.name}] Post with ID {item['id']} was not delivered. "
+                    "It will be retried in the next cycle."
                 )
-                logger.info("Detected repost in the post.")
-
-            for item_part in item_parts:
-                prepare_temp_folder()
-                repost_exists: bool = True if len(item_parts) > 1 else False
-
-                logger.info(f"Starting parsing of the {item_part}")
-                parsed_post = parse_post(item_parts[item_part], repost_exists, item_part, group_name)
-                logger.info(f"Starting sending of the {item_part}")
-                try:
-                    executor.start(
-                        dp,
-                        send_post(
-                            bot,
-                            config.TG_CHANNEL,
-                            parsed_post["text"],
-                            parsed_post["photos"],
-                            parsed_post["videos"],
-                            parsed_post["docs"],
-                        ),
+                break
+            journal.set_last_id(source.name, item["id"])
+    finally:
+        preparing.cancel()
+        try:
+            # Исключение из разбора поднимается дальше
+            await preparing
+        except asyncio.CancelledError:
+            pass
+        while not ready.empty():
+            entry = ready.get_nowait()
+            if entry and entry[1]:
+                entry[1].workspace.cleanup()
+        PIPELINE_READY_POSTS.set(0, source=source.name)
+
+
+async def process_post(sender: TelegramSender, vk: VkClient, journal: Journal, source: Source, item: dict) -> bool:
+    """Разбор и отправка одного поста во все каналы источника. False, если пост нужно повторить позже."""
+    with correlation(post_correlation_id(source.name, item["id"])):
+        prepared = await prepare_post(sender, vk, journal, source, item)
+        if prepared is None:
+            return True
+        try:
+            return await deliver_post(sender, journal, source, prepared)
+        finally:
+            prepared.workspace.cleanup()
+
+
+async def prepare_post(
+    sender: TelegramSender, vk: VkClient, journal: Journal, source: Source, item: dict
+) -> Union[PreparedPost, None]:
+    """Фильтры и разбор поста. None, если отправлять нечего."""
+    logger.info(f"[{source.name}] Working with post with ID: {item['id']}.")
+    if blacklist_check(source.blacklist_matcher, item["text"]):
+        return None
+    if whitelist_check(source.whitelist_matcher, item["text"]):
+        return None
+    if source.skip_ads_posts and item.get("marked_as_ads"):
+        logger.info("Post was skipped as an advertisement.")
+        return None
+    if source.skip_copyrighted_post and "copyright" in item:
+        logger.info("Post was skipped as an copyrighted post.")
+        return None
+
+    item_parts = {"post": item}
+    if "copy_history" in item and not source.skip_reposts:
+        item_parts["repost"] = item["copy_history"][0]
+        logger.info("Detected repost in the post.")
+    repost_exists: bool = True if len(item_parts) > 1 else False
+
+    # Уже доставленные части поста повторно не отправляются
+    pending: dict = {
+        item_part: [
+            channel
+            for channel in source.tg_channels
+            if journal.get_status(source.name, channel, item["id"], item_part) not in (SENT, ABANDONED)
+        ]
+        for item_part in item_parts
+    }
+    pending_parts = [item_part for item_part in item_parts if pending[item_part]]
+    if not pending_parts:
+        return None
+
+    # Часть, которая уже опубликована во всех своих каналах, не разбирается и ничего не скачивает
+    keys = {}
+    duplicates: Dict[str, Dict[str, int]] = {item_part: {} for item_part in pending_parts}
+    if config.DEDUP_ENABLED:
+        for item_part in pending_parts:
+            keys[item_part] = content_keys(item_parts[item_part])
+            for channel in pending[item_part]:
+                message_id = journal.find_content(channel, lookup_content_keys(item_part, keys[item_part]))
+                if message_id is not None:
+                    duplicates[item_part][channel] = message_id
+    parse_parts = [item_part for item_part in pending_parts if len(duplicates[item_part]) < len(pending[item_part])]
+
+    group_name, videos_info = await get_post_metadata(vk, item_parts) if parse_parts else ("", {})
+    workspace = source.temp_storage.workspace(str(item["id"]))
+
+    # Вложения поста и репоста разбираются одновременно
+    if parse_parts:
+        logger.info(f"Starting parsing of the {', '.join(parse_parts)}")
+    semaphore = asyncio.Semaphore(config.ATTACHMENTS_CONCURRENCY)
+    try:
+        with POST_PARSE_SECONDS.time(source=source.name):
+            parsed_parts = await asyncio.gather(
+                *(
+                    parse_post(
+                        vk.session,
+                        item_parts[item_part],
+                        repost_exists,
+                        item_part,
+                        group_name,
+                        videos_info,
+                        semaphore,
+                        workspace,
+                        sender.file_cache,
                     )
-                except RuntimeError as e:
-                    logger.error("The script was stopped (probably by the user).")
-                    logger.error(f"The error message: {e}")
-                    exit()
+                    for item_part in parse_parts
+                ),
+                return_exceptions=True,
+            )
+    except BaseException:
+        workspace.cleanup()
+        raise
 
-        write_id(new_last_id)
-        write_time()
-    write_time()
+    parts = {}
+    for item_part, parsed in zip(parse_parts, parsed_parts):
+        if isinstance(parsed, Exception):
+            # Часть, которую не удалось разобрать, не отправляется, а попытка засчитывается как неудачная
+            logger.opt(exception=parsed).error(f"Failed to parse the {item_part} of the post with ID {item['id']}.")
+            parsed = None
+        elif isinstance(parsed, BaseException):
+            workspace.cleanup()
+            raise parsed
+        parts[item_part] = parsed
+
+    return PreparedPost(
+        item,
+        parts,
+        {item_part: pending[item_part] for item_part in pending_parts},
+        workspace,
+        keys,
+        duplicates,
+    )
+
+
+async def send_part(
+    sender: TelegramSender, channel: str, item_part: str, parsed_post: Union[dict, None], duplicate: Union[int, None]
+) -> Union[int, None]:
+    """
+    Отправка части поста в канал. Репост, который уже есть в канале, заменяется ссылкой
+    на него, а уже опубликованный пост пропускается. None, если часть не отправлена:
+    любая ошибка засчитывается как неудачная попытка, чтобы пост не повторялся бесконечно.
+    """
+    try:
+        if duplicate is None:
+            if parsed_post is None:
+                # Часть не удалось разобрать
+                return None
+            return await send_post(
+                sender, channel, parsed_post["text"], parsed_post["photos"], parsed_post["videos"], parsed_post["docs"]
+            )
+        link = message_link(channel, duplicate)
+        if item_part == "repost" and link:
+            logger.info(f"The repost was already published in {channel}, sending a link to it.")
+            return await send_post(sender, channel, DUPLICATE_TEXT.format(link=link), [], [], [])
+        logger.info(f"The {item_part} was skipped for {channel}: it was already published there.")
+        return 0
+    except Exception:
+        logger.exception(f"The {item_part} was not sent to {channel} due to an unexpected error.")
+        return None
+
+
+async def deliver_post(sender: TelegramSender, journal: Journal, source: Source, prepared: PreparedPost) -> bool:
+    """Отправка разобранного поста в каналы. False, если пост нужно повторить позже."""
+    item = prepared.item
+    is_delivered = True
+    for item_part, channels in prepared.pending.items():
+        keys = prepared.keys.get(item_part, [])
+        duplicates = prepared.duplicates.get(item_part, {})
+        for channel in channels:
+            # То же содержимое могло уйти в канал, пока пост ждал отправки в конвейере
+            if keys and channel not in duplicates:
+                message_id = journal.find_content(channel, lookup_content_keys(item_part, keys))
+                if message_id is not None:
+                    duplicates[channel] = message_id
+
+        # Каналы получают пост параллельно, у каждого своя очередь отправки
+        logger.info(f"Starting sending of the {item_part} to {', '.join(channels)}")
+        results = await asyncio.gather(
+            *(
+                send_part(sender, channel, item_part, prepared.parts.get(item_part), duplicates.get(channel))
+                for channel in channels
+            )
+        )
+        for channel, message_id in zip(channels, results):
+            if message_id is not None:
+                if message_id and keys and channel not in duplicates:
+                    journal.remember_content(channel, keys, message_id)
+                journal.mark(source.name, channel, item["id"], item_part, SENT)
+                DELIVERIES.inc(source=source.name, status=SENT)
+                continue
+
+            attempts = journal.mark(source.name, channel, item["id"], item_part, FAILED)
+            if attempts < config.MAX_DELIVERY_ATTEMPTS:
+                DELIVERIES.inc(source=source.name, status=FAILED)
+                is_delivered = False
+                continue
+            logger.error(
+                f"The {item_part} of the post with ID {item['id']} was abandoned for {channel} "
+                f"after {attempts} attempts."
+            )
+            journal.mark(source.name, channel, item["id"], item_part, ABANDONED)
+            DELIVERIES.inc(source=source.name, status=ABANDONED)
+        if not is_delivered:
+            # Репост не отправляется раньше основного поста
+            break
+
+    return is_delivered
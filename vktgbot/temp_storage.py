@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import os
+import re
+import shutil
+from typing import Union
+
+from log_context import temp_logger
+from metrics import TEMP_STORAGE_BYTES
+
+# Всё, кроме букв, цифр, точки и дефиса, заменяется в именах файлов на "_"
+UNSAFE_NAME_PATTERN = re.compile(r"[^\w.-]+")
+
+
+class TempStorage:
+    """
+    Временные файлы одного источника с квотой на общий размер файлов на диске.
+
+    Каждый пост получает свой каталог (Workspace), который удаляется целиком, когда
+    пост отправлен. Остатки прошлого запуска удаляются один раз, при первом каталоге.
+    Квота считается по размерам документов, которые сообщает VK.
+    """
+
+    def __init__(self, root: str, quota: int, spool_size: int):
+        self.root = root
+        self.quota = quota
+        # Файлы не больше spool_size байт держатся в памяти и на диск не пишутся
+        self.spool_size = spool_size
+        self.used = 0
+        self.workspace_ids = itertools.count(1)
+        self.is_prepared = False
+        self.freed: Union[asyncio.Event, None] = None
+
+    def workspace(self, name: str) -> "Workspace":
+        if not self.is_prepared:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.is_prepared = True
+        return Workspace(self, os.path.join(self.root, f"{next(self.workspace_ids)}_{name}"))
+
+    async def reserve(self, workspace: "Workspace", size: int) -> bool:
+        """
+        Ждёт, пока в квоте освободится место под size байт. Ждать имеет смысл, только пока место
+        занимают другие посты: их каталоги удалятся после отправки. False, если файл больше квоты.
+        """
+        if size > self.quota:
+            return False
+        if self.freed is None:
+            self.freed = asyncio.Event()
+        while self.used + size > self.quota and self.used > workspace.reserved:
+            self.freed.clear()
+            await self.freed.wait()
+        self.used += size
+        workspace.reserved += size
+        TEMP_STORAGE_BYTES.set(self.used, folder=self.root)
+        return True
+
+    def release(self, size: int) -> None:
+        self.used -= size
+        TEMP_STORAGE_BYTES.set(self.used, folder=self.root)
+        if self.freed is not None:
+            self.freed.set()
+
+
+class Workspace:
+    """Каталог временных файлов одного поста. Создаётся при первом файле на диске."""
+
+    def __init__(self, storage: TempStorage, path: str):
+        self.storage = storage
+        self.path = path
+        self.reserved = 0
+        self.file_ids = itertools.count(1)
+
+    @property
+    def spool_size(self) -> int:
+        return self.storage.spool_size
+
+    async def reserve(self, size: int) -> bool:
+        return await self.storage.reserve(self, size)
+
+    def file_path(self, name: str) -> str:
+        """Путь для нового файла. Одноимённые документы поста не перезаписывают друг друга."""
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, f"{next(self.file_ids)}_{UNSAFE_NAME_PATTERN.sub('_', name)[-100:]}")
+
+    def cleanup(self) -> None:
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path, ignore_errors=True)
+            temp_logger.debug("Temporary folder {} was removed.", self.path)
+        self.storage.release(self.reserved)
+        self.reserved = 0
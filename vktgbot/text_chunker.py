@@ -0,0 +1,99 @@
+import re
+from typing import List, Tuple
+
+# Лимиты Telegram считаются по видимому тексту (без HTML-тегов) в единицах UTF-16
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+# Части текста: тег, HTML-сущность, абзац, перевод строки, пробелы и слово.
+# Длинные слова режутся на части, чтобы их можно было перенести без разрыва тегов
+TOKEN_PATTERN = re.compile(r"(<[^<>]*>)|(&#?\w+;)|(\n\n)|(\n)|([ \t]+)|([^<&\s]{1,64}|.)", re.S)
+TAG_NAME_PATTERN = re.compile(r"</?\s*(\w+)")
+PARAGRAPH, NEWLINE, SPACE = 3, 2, 1
+
+
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def html_length(text: str) -> int:
+    """Длина текста с HTML-разметкой так, как её считает Telegram."""
+    return sum(units for _, units, _ in _tokenize(text))
+
+
+def _tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Список (исходный текст, видимая длина, уровень разрыва после этой части)."""
+    pieces = []
+    for match in TOKEN_PATTERN.finditer(text):
+        tag, entity, paragraph, newline, spaces, _ = match.groups()
+        raw = match.group()
+        if tag:
+            pieces.append((raw, 0, 0))
+        elif entity:
+            pieces.append((raw, 1, 0))
+        else:
+            level = PARAGRAPH if paragraph else NEWLINE if newline else SPACE if spaces else 0
+            pieces.append((raw, utf16_length(raw), level))
+    return pieces
+
+
+def _apply_tag(stack: list, raw: str) -> None:
+    name = TAG_NAME_PATTERN.match(raw)
+    if not name:
+        return
+    if not raw.startswith("</"):
+        stack.append((name.group(1).lower(), raw))
+        return
+    for index in range(len(stack) - 1, -1, -1):
+        if stack[index][0] == name.group(1).lower():
+            del stack[index]
+            return
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Делит текст с HTML-разметкой на части не длиннее `limit` за один проход.
+
+    Разрыв ищется по абзацу, затем по строке, затем по пробелу; абзац и строка
+    используются, только если часть при этом заполнена хотя бы наполовину.
+    Теги и сущности не разрываются: открытые теги закрываются в конце части
+    и открываются заново в начале следующей.
+    """
+    pieces = _tokenize(text)
+    chunks = []
+    start = 0
+    opened: tuple = ()
+    while start < len(pieces):
+        stack = list(opened)
+        length = 0
+        # Для каждого уровня — последнее место разрыва: (индекс, открытые теги, длина)
+        breaks = {}
+        end = start
+        while end < len(pieces):
+            raw, units, level = pieces[end]
+            if length + units > limit and end > start:
+                break
+            if units == 0:
+                _apply_tag(stack, raw)
+            length += units
+            end += 1
+            if level:
+                breaks[level] = (end, tuple(stack), length)
+
+        cut, cut_stack = end, tuple(stack)
+        if end < len(pieces) and breaks:
+            good = [level for level in (PARAGRAPH, NEWLINE) if level in breaks and breaks[level][2] >= limit // 2]
+            if good:
+                cut, cut_stack, _ = breaks[good[0]]
+            else:
+                cut, cut_stack, _ = max(breaks.values(), key=lambda point: point[0])
+
+        chunk = (
+            "".join(raw for _, raw in opened)
+            + "".join(raw for raw, _, _ in pieces[start:cut])
+            + "".join(f"</{name}>" for name, _ in reversed(cut_stack))
+        )
+        if chunk.strip():
+            chunks.append(chunk)
+        start, opened = cut, cut_stack
+    return chunks
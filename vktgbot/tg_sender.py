@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+import aiohttp
+from aiogram import Bot
+from aiogram.utils import exceptions
+from loguru import logger
+
+from file_cache import FileIdCache
+from log_context import CORRELATION_ID, correlation
+from metrics import TG_QUEUE_DEPTH, TG_REQUEST_ERRORS, TG_REQUEST_SECONDS, TG_RETRY_AFTER_SECONDS
+
+# Ошибки, после которых запрос имеет смысл повторить: сеть, перезапуск Telegram
+# и сбои при скачивании медиа по ссылке на стороне Telegram. Отвергнутый file_id
+# (WrongFileIdentifier) не повторяется: send_posts удаляет его из кэша и отправляет медиа заново
+RETRYABLE_ERRORS = (
+    exceptions.NetworkError,
+    exceptions.RestartingTelegram,
+    exceptions.InvalidHTTPUrlContent,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+RETRYABLE_BAD_REQUESTS = (
+    "webpage_curl_failed",
+    "wrong type of the web page content",
+    "failed to get http url content",
+    "group send failed",
+)
+RETRY_BASE_DELAY = 2
+
+
+def is_retryable(ex: Exception) -> bool:
+    if isinstance(ex, RETRYABLE_ERRORS):
+        return True
+    if isinstance(ex, exceptions.BadRequest):
+        return any(message in str(ex).lower() for message in RETRYABLE_BAD_REQUESTS)
+    return False
+
+
+class TokenBucket:
+    """Не больше `rate` запросов в секунду в среднем, с всплесками до `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TelegramSender:
+    """
+    Отправка в Telegram через очереди по чатам.
+
+    Задачи одного чата выполняются строго по порядку, разные чаты — параллельно.
+    Каждый вызов Bot API проходит через общий лимит бота и лимит своего чата,
+    а ожидание RetryAfter останавливает только тот чат, которому оно пришло.
+    """
+
+    def __init__(self, bot: Bot, file_cache: FileIdCache, global_rate: float = 30, chat_rate: float = 20 / 60,
+                 chat_burst: float = 3, max_tries: int = 5):
+        self.bot = bot
+        self.file_cache = file_cache
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_tries = max_tries
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, chat_id: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Ставит задачу в очередь чата и ждёт её результат."""
+        if chat_id not in self.queues:
+            self.queues[chat_id] = asyncio.Queue()
+            self.workers[chat_id] = asyncio.create_task(self._worker(chat_id, self.queues[chat_id]))
+
+        future = asyncio.get_running_loop().create_future()
+        # Задача выполняется в задаче очереди чата, ID поста для лога передаётся вместе с ней
+        await self.queues[chat_id].put((job, future, CORRELATION_ID.get()))
+        TG_QUEUE_DEPTH.set(self.queues[chat_id].qsize(), chat=chat_id)
+        return await future
+
+    async def _worker(self, chat_id: str, queue: asyncio.Queue) -> None:
+        while True:
+            job, future, correlation_id = await queue.get()
+            TG_QUEUE_DEPTH.set(queue.qsize(), chat=chat_id)
+            # Вызвавший submit мог быть отменён: его результат уже никому не нужен,
+            # а исключение из set_result остановило бы очередь чата навсегда
+            if future.done():
+                queue.task_done()
+                continue
+            try:
+                with correlation(correlation_id):
+                    result = await job()
+            except Exception as ex:
+                if not future.done():
+                    future.set_exception(ex)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                queue.task_done()
+
+    async def request(self, chat_id: str, method: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Один вызов Bot API с соблюдением лимитов и повторами для временных ошибок."""
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+
+        method_name = getattr(method, "__name__", "request")
+        num_try = 0
+        while True:
+            await self.chat_buckets[chat_id].acquire()
+            await self.global_bucket.acquire()
+            try:
+                with TG_REQUEST_SECONDS.time(method=method_name):
+                    return await method(*args, **kwargs)
+            except exceptions.RetryAfter as ex:
+                # Ожидание по требованию Telegram не считается неудачной попыткой
+                logger.warning(f"Flood limit is exceeded for {chat_id}. Sleep {ex.timeout} seconds.")
+                TG_REQUEST_ERRORS.inc(method=method_name, error="RetryAfter")
+                TG_RETRY_AFTER_SECONDS.inc(ex.timeout, chat=chat_id)
+                await asyncio.sleep(ex.timeout)
+            except Exception as ex:
+                TG_REQUEST_ERRORS.inc(method=method_name, error=type(ex).__name__)
+                num_try += 1
+                if not is_retryable(ex) or num_try >= self.max_tries:
+                    raise
+                delay = RETRY_BASE_DELAY * 2 ** (num_try - 1)
+                logger.warning(f"Telegram request failed: {ex!r}. Retry in {delay} seconds. Try: {num_try}")
+                await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
@@ -1,42 +1,34 @@
-import os
+import hashlib
 import re
+from typing import List
 
 from loguru import logger
 
-authors = {}
+from authors import NO_LINK, AuthorRegistry
+from keyword_filter import KeywordMatcher
+from log_context import links_logger
 
-def blacklist_check(blacklist: list, text: str) -> bool:
-    if blacklist:
-        text_lower = text.lower()
-        for black_word in blacklist:
-            if black_word.lower() in text_lower:
-                logger.info(f"Post was skipped due to the detection of blacklisted word: {black_word}.")
-                return True
+# Хэш текста без вложений ставится только длинным текстам: короткие ("Стрим сегодня в 20:00!")
+# повторяются в разных записях, и их репосты нельзя заменять ссылкой на старое сообщение
+CONTENT_HASH_MIN_TEXT = 200
+
+def blacklist_check(blacklist: KeywordMatcher, text: str) -> bool:
+    black_word = blacklist.find(text)
+    if black_word is not None:
+        logger.info(f"Post was skipped due to the detection of blacklisted word: {black_word}.")
+        return True
 
     return False
 
 
-def whitelist_check(whitelist: list, text: str) -> bool:
-    if whitelist:
-        text_lower = text.lower()
-        for white_word in whitelist:
-            if white_word.lower() in text_lower:
-                return False
+def whitelist_check(whitelist: KeywordMatcher, text: str) -> bool:
+    if whitelist and whitelist.find(text) is None:
         logger.info("The post was skipped because no whitelist words were found.")
         return True
 
     return False
 
 
-def prepare_temp_folder():
-    if "temp" in os.listdir():
-        for root, dirs, files in os.walk("temp"):
-            for file in files:
-                os.remove(os.path.join(root, file))
-    else:
-        os.mkdir("temp")
-
-
 def prepare_text_for_reposts(text: str, item: dict, item_type: str, group_name: str) -> str:
     if item_type == "post" and text:
         from_id = item["copy_history"][0]["from_id"]
@@ -52,10 +44,6 @@ def prepare_text_for_reposts(text: str, item: dict, item_type: str, group_name:
     return text
 
 
-def prepare_text_for_html(text: str) -> str:
-    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
-
-
 def add_urls_to_text(text: str, urls: list, videos_urls: list) -> str:
     first_link = True
     urls = videos_urls + urls
@@ -73,26 +61,77 @@ def add_urls_to_text(text: str, urls: list, videos_urls: list) -> str:
     return text
 
 
-def split_text(text: str, fragment_size: int) -> list:
-    fragments = []
-    for fragment in range(0, len(text), fragment_size):
-        fragments.append(text[fragment : fragment + fragment_size])
-    return fragments
-
-
-def reformat_vk_links(text: str) -> str:
-    match = re.search("\[([\w.]+?)\|(.+?)\]", text)
-
-    while match:
-        left_text = text[: match.span()[0]]
-        right_text = text[match.span()[1] :]
-        matching_text = text[match.span()[0] : match.span()[1]]
-
-        link_domain, link_text = re.findall("\[(.+?)\|(.+?)\]", matching_text)[0]
-        new_link = authors.get(link_domain, f'https://vk.com/{link_domain}')
-        logger.info(f"Replaced {link_domain} with {new_link}")
-        html_link = f'<a href="{new_link}">{link_text}</a>' if new_link != "t.me/0" else link_text
-        text = left_text + html_link + right_text
-        match = re.search("\[([\w.]+?)\|(.+?)\]", text)
+def content_keys(item: dict) -> List[str]:
+    """
+    Ключи содержимого поста или репоста для поиска уже опубликованного: сама запись VK
+    и хэш текста со списком вложений, одинаковый у одного и того же поста на разных стенах.
+    Без вложений хэш есть только у текста не короче CONTENT_HASH_MIN_TEXT.
+    """
+    keys = [f"wall{item['owner_id']}_{item['id']}"]
+    attachments = []
+    for attachment in item.get("attachments", []):
+        media = attachment.get(attachment["type"], {})
+        if attachment["type"] == "link":
+            attachments.append(media.get("url", ""))
+        else:
+            attachments.append(f"{attachment['type']}{media.get('owner_id')}_{media.get('id')}")
+    text = item.get("text", "").strip()
+    if attachments or len(text) >= CONTENT_HASH_MIN_TEXT:
+        content = "\n".join([text] + attachments)
+        keys.append("sha1:" + hashlib.sha1(content.encode()).hexdigest())
+    return keys
+
+
+def lookup_content_keys(item_part: str, keys: List[str]) -> List[str]:
+    """
+    Ключи, по которым часть поста ищется среди опубликованного. По хэшу ищутся только репосты:
+    у новых постов стены текст может повторяться (регулярные объявления), и такой пост
+    нельзя пропускать. Сам пост находится только по своему ID в VK.
+    """
+    return keys if item_part == "repost" else keys[:1]
+
+
+VK_LINK_PATTERN = r"\[(?P<link_domain>[\w.]+?)\|(?P<link_text>[^\]\n]+?)\]"
+
+
+class TextTransformer:
+    """
+    Подготовка текста поста: экранирование HTML и замена всех ссылок VK вида [id1|Имя]
+    (с подстановкой авторов из authors.csv) за один проход регулярного выражения.
+    Спецсимволы экранируются встроенным str.replace до поиска ссылок: на обычных постах
+    это быстрее, чем вызывать Python-функцию на каждое совпадение.
+
+    Замены подстрок из настроек делает replace_literals: они применяются
+    к готовому тексту поста вместе с заголовком репоста и ссылками.
+    """
+
+    def __init__(self, replacements: dict, authors: AuthorRegistry):
+        self.replacements = replacements
+        self.authors = authors
+        # Несколько подстрок ищутся одним выражением, чтобы замена не попала под следующую;
+        # длинные проверяются раньше коротких, которые могут в них входить
+        literals = "|".join(re.escape(literal) for literal in sorted(replacements, key=len, reverse=True))
+        self.literal_pattern = re.compile(literals) if len(replacements) > 1 else None
+        self.link_pattern = re.compile(VK_LINK_PATTERN)
+
+    def __call__(self, text: str) -> str:
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+        if "[" not in text:
+            return text
+        return self.link_pattern.sub(self._replace_link, text)
+
+    def replace_literals(self, text: str) -> str:
+        if self.literal_pattern is not None:
+            return self.literal_pattern.sub(lambda match: self.replacements[match.group()], text)
+        for old, new in self.replacements.items():
+            text = text.replace(old, new)
+        return text
 
-    return text
+    def _replace_link(self, match: re.Match) -> str:
+        link_domain, link_text = match.group("link_domain", "link_text")
+        handle = self.authors.get(link_domain)
+        if handle == NO_LINK:
+            return link_text
+        new_link = f"t.me/{handle}" if handle else f"https://vk.com/{link_domain}"
+        links_logger.debug("Replaced {} with {}", link_domain, new_link)
+        return f'<a href="{new_link}">{link_text}</a>'
@@ -0,0 +1,83 @@
+import asyncio
+from collections import OrderedDict
+from typing import Union
+
+import aiohttp
+from loguru import logger
+
+from log_context import videos_logger
+
+# Telegram не скачивает по ссылке видео больше 20 МБ
+VIDEO_SIZE_LIMIT = 20000000
+
+# Заниженная оценка битрейта (бит/с) для каждого качества VK.
+# Если даже по ней видео не влезает в лимит, HEAD-запрос не нужен.
+MIN_BITRATES = {
+    144: 60000,
+    240: 120000,
+    360: 250000,
+    480: 400000,
+    720: 800000,
+    1080: 1500000,
+    1440: 3000000,
+    2160: 6000000,
+}
+
+# HEAD-запрос к одному качеству не должен задерживать разбор поста
+HEAD_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+SIZES_CACHE_LIMIT = 4096
+_sizes: OrderedDict = OrderedDict()
+
+
+async def get_file_size(session: aiohttp.ClientSession, url: str) -> Union[int, None]:
+    """Размер файла по Content-Length, с кэшем по URL. None, если размер узнать не удалось."""
+    if url in _sizes:
+        _sizes.move_to_end(url)
+        return _sizes[url]
+
+    try:
+        async with session.head(url, timeout=HEAD_TIMEOUT) as response:
+            if response.status >= 400:
+                videos_logger.debug("HEAD request to {} returned {}.", url, response.status)
+                return None
+            size = int(response.headers.get("Content-Length", 0))
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as ex:
+        videos_logger.debug("HEAD request to {} failed: {!r}.", url, ex)
+        return None
+
+    _sizes[url] = size
+    if len(_sizes) > SIZES_CACHE_LIMIT:
+        _sizes.popitem(last=False)
+    return size
+
+
+def estimate_min_size(quality: int, duration: int) -> int:
+    return duration * MIN_BITRATES.get(quality, 0) // 8
+
+
+async def choose_video_url(
+    session: aiohttp.ClientSession, files: dict, duration: int = 0, size_limit: int = VIDEO_SIZE_LIMIT
+) -> Union[str, None]:
+    """Лучшее качество mp4, которое укладывается в лимит размера."""
+    qualities = sorted(
+        (int(key.split("_")[1]), url) for key, url in files.items() if key.startswith("mp4_")
+    )
+    if not qualities:
+        return None
+
+    candidates = [(quality, url) for quality, url in qualities if estimate_min_size(quality, duration) <= size_limit]
+    if not candidates:
+        # Даже самое низкое качество заведомо больше лимита
+        logger.info(f"The video was skipped due to its size exceeding the 20MB limit: {qualities[0][1]}")
+        return None
+
+    # Все оставшиеся качества проверяются одновременно. Качество, размер которого узнать не удалось, пропускается
+    sizes = await asyncio.gather(*(get_file_size(session, url) for _, url in candidates))
+    for (quality, url), size in sorted(zip(candidates, sizes), reverse=True):
+        if size is not None and size <= size_limit:
+            videos_logger.debug("Best quality key: mp4_{}", quality)
+            return url
+
+    logger.info(f"The video was skipped due to its size exceeding the 20MB limit: {candidates[0][1]}")
+    return None
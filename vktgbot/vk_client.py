@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import json
+import time
+from typing import List, Tuple, Union
+
+import aiohttp
+from loguru import logger
+
+from metrics import VK_REQUEST_ERRORS, VK_REQUEST_SECONDS
+
+VK_API_URL = "https://api.vk.com/method/"
+
+# Таймауты отдельных методов VK API, в секундах
+METHOD_TIMEOUTS = {
+    "wall.get": 15,
+    "wall.getById": 10,
+    "video.get": 10,
+    "groups.getById": 5,
+    "execute": 20,
+}
+DEFAULT_TIMEOUT = 10
+
+# VK позволяет не больше 25 обращений к API внутри одного execute
+EXECUTE_MAX_CALLS = 25
+
+# Коды ошибок, после которых запрос имеет смысл повторить:
+# 6 — слишком много запросов в секунду, 10 — внутренняя ошибка сервера
+RETRYABLE_ERRORS = (6, 10)
+MAX_TRIES = 3
+
+
+class VkApiError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"[{code}] {message}")
+        self.code = code
+        self.message = message
+
+
+class RateLimiter:
+    """Пропускает не больше `rate` запросов за `period` секунд."""
+
+    def __init__(self, rate: int = 3, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._calls: collections.deque = collections.deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.rate:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._calls[0]))
+
+
+def create_session(connections_limit: int = 20) -> aiohttp.ClientSession:
+    """Общая сессия с пулом keep-alive соединений для VK и загрузки медиа."""
+    connector = aiohttp.TCPConnector(limit=connections_limit, keepalive_timeout=60, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector)
+
+
+class VkClient:
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        token: str,
+        version: float,
+        rate_limiter: Union[RateLimiter, None] = None,
+        api_url: str = VK_API_URL,
+    ):
+        self.session = session
+        self.token = token
+        self.version = version
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.api_url = api_url
+
+    async def call(self, method: str, **params) -> Union[dict, list, int]:
+        """Вызов метода VK API. Возвращает поле `response` или бросает VkApiError."""
+        data = dict(params, access_token=self.token, v=str(self.version))
+        timeout = aiohttp.ClientTimeout(total=METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT))
+
+        for num_try in range(1, MAX_TRIES + 1):
+            await self.rate_limiter.acquire()
+            try:
+                with VK_REQUEST_SECONDS.time(method=method):
+                    async with self.session.post(self.api_url + method, data=data, timeout=timeout) as response:
+                        result = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                VK_REQUEST_ERRORS.inc(method=method, error=type(ex).__name__)
+                raise
+
+            if "error" not in result:
+                return result["response"]
+
+            error = VkApiError(result["error"]["error_code"], result["error"]["error_msg"])
+            VK_REQUEST_ERRORS.inc(method=method, error=error.code)
+            if error.code not in RETRYABLE_ERRORS or num_try == MAX_TRIES:
+                raise error
+            logger.warning(f"VK API method {method} failed with {error}. Try: {num_try}")
+            await asyncio.sleep(num_try)
+
+    async def execute(self, calls: List[Tuple[str, dict]]) -> list:
+        """
+        Упаковывает несколько вызовов API в один запрос execute.
+        Возвращает ответы в порядке вызовов, None на месте неудачных.
+        """
+        results: list = []
+        for start in range(0, len(calls), EXECUTE_MAX_CALLS):
+            chunk = calls[start : start + EXECUTE_MAX_CALLS]
+            code = "return [{}];".format(
+                ",".join(f"API.{method}({json.dumps(params, ensure_ascii=False)})" for method, params in chunk)
+            )
+            response = await self.call("execute", code=code)
+            results.extend(item if item is not False else None for item in response)
+        return results